@@ -20,7 +20,7 @@ import com.fasterxml.jackson.databind.JsonNode
 import java.util.Date
 
 enum class StatusType {
-    SUCCESS, FAILURE
+    SUCCESS, FAILURE, TIMEOUT
 }
 
 data class RemoteIdentifier(
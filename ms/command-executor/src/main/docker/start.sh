@@ -39,4 +39,10 @@ then
 fi
 
 cd /opt/app/onap/python/
-python server.py ${APP_PORT} ${BASIC_AUTH}
\ No newline at end of file
+if [ "${CE_ASYNC_SERVER}" = "true" ]
+then
+  echo "Starting the asyncio command executor server."
+  python aio_server.py ${APP_PORT} ${BASIC_AUTH}
+else
+  python server.py ${APP_PORT} ${BASIC_AUTH}
+fi
\ No newline at end of file
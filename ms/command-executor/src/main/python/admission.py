@@ -0,0 +1,182 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import deque
+
+import asyncio
+import os
+import threading
+
+# Limits, 0 disables the corresponding check
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('CE_ADMISSION_MAX_CONCURRENT', '0'))
+ADMISSION_MAX_PER_BLUEPRINT = int(os.environ.get('CE_ADMISSION_MAX_PER_BLUEPRINT', '0'))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.environ.get('CE_ADMISSION_MAX_QUEUE_DEPTH', '0'))
+ADMISSION_MAX_WAIT = float(os.environ.get('CE_ADMISSION_MAX_WAIT', '0'))
+# Share of the slots each blueprint gets while others are queued too, as "name=weight" or "name/version=weight"
+ADMISSION_WEIGHTS = os.environ.get('CE_ADMISSION_WEIGHTS', '')
+ADMISSION_DEFAULT_WEIGHT = float(os.environ.get('CE_ADMISSION_DEFAULT_WEIGHT', '1'))
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class _Waiter:
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.admitted = False
+
+
+class _Tenant:
+
+    def __init__(self, weight):
+        self.weight = weight
+        self.waiters = deque()
+        self.running = 0
+        # Virtual time of the next request of this blueprint; the lowest one among the queued blueprints goes first
+        self.pass_ = 0.0
+
+
+class AdmissionController:
+    """Decides which executeCommand requests run now, and in which order the others do.
+
+    Running requests are capped globally and per blueprint. Waiting requests are queued per blueprint and the free
+    slots are handed out by weighted fair queuing between blueprints (stride scheduling over virtual time), so a
+    blueprint fanning out hundreds of commands only delays the others by its share. A request finding the queue full,
+    or still queued after the maximum wait, is rejected instead of piling up inside gRPC.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_per_blueprint=ADMISSION_MAX_PER_BLUEPRINT,
+                 max_queue_depth=ADMISSION_MAX_QUEUE_DEPTH, max_wait=ADMISSION_MAX_WAIT, weights=ADMISSION_WEIGHTS,
+                 default_weight=ADMISSION_DEFAULT_WEIGHT):
+        self.max_concurrent = max_concurrent
+        self.max_per_blueprint = max_per_blueprint
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+        self.weights = self.parse_weights(weights)
+        self.default_weight = default_weight
+        self.running = 0
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self._tenants = {}
+        self._vtime = 0.0
+
+    @staticmethod
+    def parse_weights(weights):
+        parsed = {}
+        for entry in weights.split(','):
+            if '=' in entry:
+                name, weight = entry.rsplit('=', 1)
+                parsed[name.strip()] = float(weight)
+        return parsed
+
+    def get_weight(self, blueprint_id):
+        weight = self.weights.get(blueprint_id, self.weights.get(blueprint_id.split('/')[0], self.default_weight))
+        return max(weight, 0.001)
+
+    def acquire(self, blueprint_id):
+        event = threading.Event()
+        waiter = self._enqueue(blueprint_id, event.set)
+        if waiter.admitted:
+            return
+        event.wait(self.max_wait or None)
+        self._check_admitted(blueprint_id, waiter)
+
+    async def acquire_async(self, blueprint_id):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def set_result():
+            if not future.done():
+                future.set_result(None)
+
+        waiter = self._enqueue(blueprint_id, lambda: loop.call_soon_threadsafe(set_result))
+        if waiter.admitted:
+            return
+        try:
+            await asyncio.wait_for(future, self.max_wait or None)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Admitted while the request was being cancelled: give the slot back
+            with self._lock:
+                if not waiter.admitted:
+                    self._remove(blueprint_id, waiter)
+                    raise
+            self.release(blueprint_id)
+            raise
+        self._check_admitted(blueprint_id, waiter)
+
+    def release(self, blueprint_id):
+        with self._lock:
+            tenant = self._tenants[blueprint_id]
+            tenant.running -= 1
+            self.running -= 1
+            self._forget(blueprint_id, tenant)
+            self._dispatch()
+
+    def _enqueue(self, blueprint_id, wake):
+        waiter = _Waiter(wake)
+        with self._lock:
+            tenant = self._tenants.get(blueprint_id)
+            if tenant is None:
+                tenant = self._tenants[blueprint_id] = _Tenant(self.get_weight(blueprint_id))
+            if not tenant.waiters:
+                # A blueprint coming back after being idle does not get credit for the time it did not use
+                tenant.pass_ = max(tenant.pass_, self._vtime)
+            tenant.waiters.append(waiter)
+            self.waiting += 1
+            self._dispatch()
+            if not waiter.admitted and self.max_queue_depth and self.waiting > self.max_queue_depth:
+                self._remove(blueprint_id, waiter)
+                raise AdmissionRejected("Too many queued requests ({}), rejecting {}".format(
+                    self.max_queue_depth, blueprint_id))
+        return waiter
+
+    def _check_admitted(self, blueprint_id, waiter):
+        with self._lock:
+            if waiter.admitted:
+                return
+            self._remove(blueprint_id, waiter)
+        raise AdmissionRejected("{} waited more than {} seconds to run".format(blueprint_id, self.max_wait))
+
+    def _remove(self, blueprint_id, waiter):
+        # Called with the lock held
+        tenant = self._tenants[blueprint_id]
+        tenant.waiters.remove(waiter)
+        self.waiting -= 1
+        self._forget(blueprint_id, tenant)
+
+    def _forget(self, blueprint_id, tenant):
+        if not tenant.waiters and not tenant.running:
+            del self._tenants[blueprint_id]
+
+    def _dispatch(self):
+        # Called with the lock held
+        while not self.max_concurrent or self.running < self.max_concurrent:
+            eligible = [tenant for tenant in self._tenants.values() if tenant.waiters and (
+                not self.max_per_blueprint or tenant.running < self.max_per_blueprint)]
+            if not eligible:
+                return
+            tenant = min(eligible, key=lambda t: t.pass_)
+            waiter = tenant.waiters.popleft()
+            self.waiting -= 1
+            tenant.running += 1
+            self.running += 1
+            self._vtime = tenant.pass_
+            tenant.pass_ += 1 / tenant.weight
+            waiter.admitted = True
+            waiter.wake()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Alternative to server.py serving the command executor from a single asyncio event loop, so the number of commands
+# running at once is no longer bound by a thread pool. Requires a grpcio release providing grpc.aio.
+#
+import asyncio
+import logging
+import sys
+
+import grpc
+from grpc import aio
+
+import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
+
+from command_executor_aio_server import AsyncCommandExecutorServer
+from command_executor_handler import ENV_MANAGER
+from metrics import METRICS_PORT, start_http_server
+
+logger = logging.getLogger("Server")
+
+
+def _unary_unary_rpc_terminator(code, details):
+    async def terminate(ignored_request, context):
+        await context.abort(code, details)
+
+    return grpc.unary_unary_rpc_method_handler(terminate)
+
+
+class AsyncRequestHeaderValidatorInterceptor(aio.ServerInterceptor):
+
+    def __init__(self, header, value, code, details):
+        self._header = header
+        self._value = value
+        self._terminator = _unary_unary_rpc_terminator(code, details)
+
+    async def intercept_service(self, continuation, handler_call_details):
+        if (self._header, self._value) in handler_call_details.invocation_metadata:
+            return await continuation(handler_call_details)
+        else:
+            return self._terminator
+
+
+async def serve():
+    port = sys.argv[1]
+    basic_auth = sys.argv[2] + ' ' + sys.argv[3]
+
+    header_validator = AsyncRequestHeaderValidatorInterceptor(
+        'authorization', basic_auth, grpc.StatusCode.UNAUTHENTICATED,
+        'Access denied!')
+
+    server = aio.server(interceptors=(header_validator,))
+
+    CommandExecutor_pb2_grpc.add_CommandExecutorServiceServicer_to_server(
+        AsyncCommandExecutorServer(), server)
+
+    server.add_insecure_port('[::]:' + port)
+    await server.start()
+    ENV_MANAGER.start()
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+
+    logger.info("Command Executor Server (asyncio) started on %s" % port)
+
+    try:
+        await server.wait_for_termination()
+    except KeyboardInterrupt:
+        await server.stop(0)
+
+
+if __name__ == '__main__':
+    logging_formater = '%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s'
+    logging.basicConfig(filename='/opt/app/onap/logs/application.log', level=logging.DEBUG,
+                        format=logging_formater)
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    formatter = logging.Formatter(logging_formater)
+    console.setFormatter(formatter)
+    logging.getLogger('').addHandler(console)
+    asyncio.get_event_loop().run_until_complete(serve())
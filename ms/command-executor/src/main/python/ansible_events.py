@@ -0,0 +1,84 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+import os
+import tempfile
+
+ANSIBLE_EVENTS_ENABLED = os.environ.get('CE_ANSIBLE_EVENTS', 'false') == "true"
+CALLBACK_PLUGINS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ansible_plugins', 'callback')
+CALLBACK_NAME = 'cds_events'
+# Must match ansible_plugins/callback/cds_events.py, which runs inside the blueprint environment
+EVENTS_FILE_ENV = 'CDS_ANSIBLE_EVENTS_FILE'
+
+
+def _append(value, item, separator):
+    return separator.join(filter(None, [value, item]))
+
+
+def get_callback_env(env):
+    # Enabled next to whatever callbacks the environment already enables; the older setting name is kept for ansible
+    # releases before 2.11. The callback does nothing in processes without the events file, like the fork server.
+    return {
+        'ANSIBLE_CALLBACK_PLUGINS': _append(env.get('ANSIBLE_CALLBACK_PLUGINS'), CALLBACK_PLUGINS, ':'),
+        'ANSIBLE_CALLBACKS_ENABLED': _append(env.get('ANSIBLE_CALLBACKS_ENABLED'), CALLBACK_NAME, ','),
+        'ANSIBLE_CALLBACK_WHITELIST': _append(env.get('ANSIBLE_CALLBACK_WHITELIST'), CALLBACK_NAME, ',')
+    }
+
+
+class AnsibleEvents:
+    """Events of an ansible-playbook command, written by the bundled cds_events callback plugin to a side file.
+
+    Once the command is over they are aggregated per task and per host, so the payload gives the outcome of every
+    task without anybody parsing the ansible text output.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix='cds-ansible-events-', suffix='.jsonl')
+        os.close(fd)
+        self.results = None
+
+    def get_env(self, env):
+        return {EVENTS_FILE_ENV: self.path, **get_callback_env(env)}
+
+    def close(self):
+        try:
+            self.results = self.aggregate()
+        finally:
+            os.remove(self.path)
+
+    def aggregate(self):
+        play = None
+        tasks = {}
+        stats = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Partial last line of a playbook that was killed
+                    continue
+                kind = event.pop('event', None)
+                if kind == 'play':
+                    play = event['name']
+                elif kind == 'task':
+                    tasks[event['id']] = {'play': play, 'task': event['name'], 'hosts': {}}
+                elif kind == 'result' and event['task'] in tasks:
+                    host = event.pop('host')
+                    tasks[event.pop('task')]['hosts'][host] = event
+                elif kind == 'stats':
+                    stats = event['hosts']
+        # Tasks that never got a result, like the ones after a play failed for every host, carry no information
+        return {'tasks': [task for task in tasks.values() if task['hosts']], 'stats': stats}
@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Ansible callback plugin enabled by the command executor for ansible-playbook commands. It writes one compact JSON
+# line per play, task, host result and final stats to the file named by CDS_ANSIBLE_EVENTS_FILE, which the executor
+# aggregates into the command payload.
+#
+# Loaded by ansible from the blueprint venv, it must only depend on ansible and the standard library.
+#
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    callback: cds_events
+    type: aggregate
+    short_description: Structured task events for the CDS command executor
+    description:
+      - Writes compact JSON events to the file named by the CDS_ANSIBLE_EVENTS_FILE environment variable.
+'''
+
+EVENTS_FILE_ENV = 'CDS_ANSIBLE_EVENTS_FILE'
+# Longest text kept from a result field, the full output is still in the command log
+MAX_FIELD_LENGTH = 4096
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'cds_events'
+    CALLBACK_NEEDS_WHITELIST = True
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        path = os.environ.get(EVENTS_FILE_ENV)
+        self.events = open(path, 'a') if path else None
+
+    def emit(self, event):
+        if self.events is not None:
+            self.events.write(json.dumps(event, separators=(',', ':'), default=str) + '\n')
+            self.events.flush()
+
+    def v2_playbook_on_play_start(self, play):
+        self.emit({'event': 'play', 'name': play.get_name()})
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.emit({'event': 'task', 'id': task._uuid, 'name': task.get_name()})
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.emit({'event': 'task', 'id': task._uuid, 'name': task.get_name()})
+
+    def v2_runner_on_ok(self, result):
+        self.emit_result(result, 'changed' if result._result.get('changed') else 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.emit_result(result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self.emit_result(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self.emit_result(result, 'unreachable')
+
+    def emit_result(self, result, status):
+        event = {'event': 'result', 'task': result._task._uuid, 'host': result._host.get_name(), 'status': status}
+        details = result._result
+        for key in ('msg', 'rc', 'stderr') if status in ('failed', 'ignored', 'unreachable') else ('msg',):
+            value = details.get(key)
+            if value not in (None, ''):
+                event[key] = value[:MAX_FIELD_LENGTH] if isinstance(value, str) else value
+        self.emit(event)
+
+    def v2_playbook_on_stats(self, stats):
+        hosts = {}
+        for host in sorted(stats.processed.keys()):
+            hosts[host] = stats.summarize(host)
+        self.emit({'event': 'stats', 'hosts': hosts})
+        if self.events is not None:
+            self.events.close()
+            self.events = None
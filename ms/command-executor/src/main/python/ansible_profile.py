@@ -0,0 +1,104 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import logging
+import os
+import tempfile
+
+from admission import ADMISSION_MAX_CONCURRENT
+
+ANSIBLE_PROFILE_ENABLED = os.environ.get('CE_ANSIBLE_PROFILE', 'false') == "true"
+ANSIBLE_PIPELINING = os.environ.get('CE_ANSIBLE_PIPELINING', 'true') == "true"
+# SSH master connections are kept open that long after the last playbook used them, empty disables ControlPersist
+ANSIBLE_CONTROL_PERSIST = os.environ.get('CE_ANSIBLE_CONTROL_PERSIST', '300s')
+ANSIBLE_FACT_CACHE_TIMEOUT = int(os.environ.get('CE_ANSIBLE_FACT_CACHE_TIMEOUT', '86400'))
+# linear (ansible default) or free
+ANSIBLE_STRATEGY = os.environ.get('CE_ANSIBLE_STRATEGY', '')
+# Forks per playbook; by default the fork budget is split between the playbooks admission lets run at once
+ANSIBLE_FORKS = int(os.environ.get('CE_ANSIBLE_FORKS', '0'))
+ANSIBLE_FORK_BUDGET = int(os.environ.get('CE_ANSIBLE_FORK_BUDGET', '200'))
+
+ANSIBLE_CFG = 'ansible.cfg'
+GENERATED_HEADER = "# Generated by the command executor, remove this line to maintain this file by hand\n"
+
+
+class AnsibleProfile:
+    """ansible.cfg written in the blueprint directory, where ansible-playbook commands run, to make them cheaper.
+
+    Pipelining and SSH ControlPersist save the connection setup of every task, and the JSON file fact cache under
+    the blueprint directory saves gathering facts again on each run against the same devices. An ansible.cfg the
+    blueprint brings along, or one ANSIBLE_CONFIG points to, always takes precedence.
+    """
+
+    def __init__(self, enabled=ANSIBLE_PROFILE_ENABLED, pipelining=ANSIBLE_PIPELINING,
+                 control_persist=ANSIBLE_CONTROL_PERSIST, fact_cache_timeout=ANSIBLE_FACT_CACHE_TIMEOUT,
+                 strategy=ANSIBLE_STRATEGY, forks=ANSIBLE_FORKS):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = enabled
+        self.pipelining = pipelining
+        self.control_persist = control_persist
+        self.fact_cache_timeout = fact_cache_timeout
+        self.strategy = strategy
+        self.forks = forks or self.get_default_forks()
+
+    @staticmethod
+    def get_default_forks():
+        if not ADMISSION_MAX_CONCURRENT:
+            return 0
+        return max(1, ANSIBLE_FORK_BUDGET // ADMISSION_MAX_CONCURRENT)
+
+    def render(self, venv_home):
+        lines = [GENERATED_HEADER, "[defaults]\n"]
+        if self.forks:
+            lines.append("forks = %d\n" % self.forks)
+        if self.strategy:
+            lines.append("strategy = %s\n" % self.strategy)
+        if self.fact_cache_timeout:
+            lines.append("gathering = smart\n")
+            lines.append("fact_caching = jsonfile\n")
+            lines.append("fact_caching_connection = %s\n" % os.path.join(venv_home, ".ansible", "facts"))
+            lines.append("fact_caching_timeout = %d\n" % self.fact_cache_timeout)
+        lines.append("\n[ssh_connection]\n")
+        lines.append("pipelining = %s\n" % self.pipelining)
+        if self.control_persist:
+            lines.append("ssh_args = -C -o ControlMaster=auto -o ControlPersist=%s\n" % self.control_persist)
+        return ''.join(lines)
+
+    def apply(self, venv_home):
+        if not self.enabled:
+            return
+        path = os.path.join(venv_home, ANSIBLE_CFG)
+        content = self.render(venv_home)
+        try:
+            with open(path) as f:
+                current = f.read()
+            if current == content or not current.startswith(GENERATED_HEADER):
+                return
+        except FileNotFoundError:
+            pass
+        # Written aside and renamed, concurrent playbooks of the blueprint never read a partial file
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.%s.' % ANSIBLE_CFG, suffix='.tmp', dir=venv_home)
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            os.chmod(tmp, 0o644)
+            os.rename(tmp, path)
+            self.logger.info("Generated {}".format(path))
+        except OSError as err:
+            # Playbooks still run, with stock settings
+            self.logger.info("Failed to generate {}. Error: {}".format(path, err))
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
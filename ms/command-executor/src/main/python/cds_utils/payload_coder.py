@@ -1,13 +1,43 @@
 import json
+import os
+import stat
+import struct
 from email.mime import multipart
 from email.mime import text
 import email.parser
 
+# Set by the command executor to the descriptor of a pipe reserved for the response payload
+PAYLOAD_FD_ENV = 'CDS_PAYLOAD_FD'
+
+
 def send_response_data_payload(json_payload):
+    if _send_on_payload_channel(json_payload):
+        return
     m = multipart.MIMEMultipart("form-data")
     data = text.MIMEText("response_payload", "json", "utf8")
     data.set_payload(json.JSONEncoder().encode(json_payload))
     m.attach(data)
     print("BEGIN_EXTRA_PAYLOAD")
     print(m.as_string())
-    print("END_EXTRA_PAYLOAD")
\ No newline at end of file
+    print("END_EXTRA_PAYLOAD")
+
+
+def _send_on_payload_channel(json_payload):
+    payload_fd = os.environ.get(PAYLOAD_FD_ENV)
+    if not payload_fd:
+        return False
+    try:
+        # Processes started with close_fds may have the descriptor closed or reused for an unrelated file
+        if not stat.S_ISFIFO(os.fstat(int(payload_fd)).st_mode):
+            return False
+    except (OSError, ValueError):
+        return False
+    data = json.JSONEncoder().encode(json_payload).encode("utf8")
+    frame = memoryview(struct.pack("!I", len(data)) + data)
+    try:
+        while frame:
+            frame = frame[os.write(int(payload_fd), frame):]
+        return True
+    except (OSError, ValueError):
+        # Not inherited (e.g. run outside the executor), fall back to the stdout markers
+        return False
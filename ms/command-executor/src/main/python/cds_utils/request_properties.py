@@ -0,0 +1,20 @@
+import json
+import os
+import sys
+
+
+def read_request_properties(argv=None):
+    """Returns the executeCommand request properties, however the command executor delivered them.
+
+    By default the properties are the JSON last argument of the command line; when the executor is configured to
+    deliver them on stdin or in a file, CDS_PROPERTIES_DELIVERY says so.
+    """
+    delivery = os.environ.get('CDS_PROPERTIES_DELIVERY', 'argv')
+    if delivery == 'file':
+        with open(os.environ['CDS_PROPERTIES_FILE']) as f:
+            return json.load(f)
+    if delivery == 'stdin':
+        return json.load(sys.stdin)
+    if argv is None:
+        argv = sys.argv
+    return json.loads(argv[-1])
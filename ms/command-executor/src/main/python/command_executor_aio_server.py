@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from concurrent import futures
+import asyncio
+import grpc
+import os
+import time
+import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+
+from admission import AdmissionRejected
+from metrics import COMMAND_QUEUE_WAIT_SECONDS
+from command_executor_handler import CommandExecutorHandler, prepare_env
+from command_executor_server import CommandExecutorServer
+from output_stream import AsyncOutputStream
+import utils
+
+# Commands running at once; a running command only costs a child process and a few file descriptors, not a thread
+MAX_CONCURRENT_COMMANDS = int(os.environ.get('CE_MAX_CONCURRENT_COMMANDS', '256'))
+# Threads for the blocking work left: package installs of prepareEnv and re-provisioning of evicted environments
+BLOCKING_WORKERS = int(os.environ.get('CE_BLOCKING_WORKERS', '15'))
+
+
+class AsyncCommandExecutorServer(CommandExecutorServer):
+    """CommandExecutorServer for the grpc.aio server, where every RPC is a coroutine on a single event loop."""
+
+    def __init__(self, max_concurrent_commands=MAX_CONCURRENT_COMMANDS, blocking_workers=BLOCKING_WORKERS):
+        super().__init__()
+        self.commands = asyncio.Semaphore(max_concurrent_commands)
+        self.executor = futures.ThreadPoolExecutor(max_workers=blocking_workers)
+
+    async def prepareEnv(self, request, context):
+        blueprint_id = utils.get_blueprint_id(request)
+        self.logger.info("{} - Received prepareEnv request".format(blueprint_id))
+        self.logger.info(request)
+
+        success, results, timed_out = await asyncio.get_event_loop().run_in_executor(self.executor, prepare_env,
+                                                                                     request)
+        return self.prepare_env_response(blueprint_id, request, success, results, timed_out)
+
+    async def executeCommand(self, request, context):
+        blueprint_id = self.received(request, "executeCommand")
+        key = self.results.get_key(request, context.invocation_metadata())
+        if key is None:
+            return await self.execute_command(blueprint_id, request, context)
+        ret = await self.attach(blueprint_id, key, context)
+        if ret is not None:
+            return ret
+        # Not cancelled along with this RPC: when the client gives up, the retry it sends attaches to the execution
+        execution = asyncio.ensure_future(self.execute_command(blueprint_id, request, context))
+        execution.add_done_callback(lambda task: self.results.complete(
+            key, None if task.cancelled() or task.exception() is not None else task.result()))
+        return await asyncio.shield(execution)
+
+    async def execute_command(self, blueprint_id, request, context):
+        await self.admit(blueprint_id, context)
+        log_results = []
+        handler = CommandExecutorHandler(request)
+        try:
+            async with self.commands:
+                payload_result = await handler.execute_command_async(request, log_results, self.executor)
+        finally:
+            self.admission.release(blueprint_id)
+        return self.execution_response(blueprint_id, request, payload_result, log_results)
+
+    async def executeCommandStream(self, request, context):
+        blueprint_id = self.received(request, "executeCommandStream")
+        await self.admit(blueprint_id, context)
+        # The command runs as its own task, feeding its output lines into the stream this RPC drains
+        stream = AsyncOutputStream()
+        handler = CommandExecutorHandler(request)
+
+        async def execute_command():
+            payload_result = {"cds_return_code": 1}
+            try:
+                async with self.commands:
+                    payload_result = await handler.execute_command_async(request, stream, self.executor) or \
+                                     payload_result
+            except Exception as err:
+                self.logger.info("{} - Failed to executeCommand. Error: {}".format(blueprint_id, err))
+            await stream.close(payload_result)
+
+        worker = asyncio.ensure_future(execute_command())
+        # Released once the command is over, even when the task is cancelled before it even started
+        worker.add_done_callback(lambda _: self.admission.release(blueprint_id))
+        try:
+            async for lines in stream.batches():
+                yield CommandExecutor_pb2.ExecutionStreamOutput(requestId=request.requestId, response=lines)
+            await worker
+        finally:
+            # Cancelled RPC: stop the command instead of letting it run for nobody
+            if not worker.done():
+                worker.cancel()
+
+        ret = self.execution_response(blueprint_id, request, stream.result)
+        yield CommandExecutor_pb2.ExecutionStreamOutput(requestId=request.requestId, result=ret)
+
+    async def attach(self, blueprint_id, key, context):
+        while True:
+            execution = self.claim(blueprint_id, key)
+            if execution is None:
+                return None
+            try:
+                # Shielded: a retry giving up must not cancel the execution the other requests wait for
+                ret = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(execution)),
+                                             utils.get_time_remaining(context))
+            except asyncio.TimeoutError:
+                await context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, "First execution of the request still running")
+            if ret is not None:
+                return ret
+
+    async def admit(self, blueprint_id, context):
+        start = time.monotonic()
+        try:
+            await self.admission.acquire_async(blueprint_id)
+        except AdmissionRejected as err:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self.rejected(blueprint_id, err))
+        COMMAND_QUEUE_WAIT_SECONDS.observe(time.monotonic() - start)
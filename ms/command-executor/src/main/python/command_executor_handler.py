@@ -14,21 +14,169 @@
 # limitations under the License.
 #
 from builtins import Exception, open, dict
-from subprocess import CalledProcessError, PIPE
-from google.protobuf.json_format import MessageToJson
+from concurrent import futures
+from contextlib import contextmanager
+from subprocess import PIPE
+from types import MappingProxyType
+from google.protobuf.json_format import MessageToDict, MessageToJson, Parse
 
+import asyncio
+import glob
 import logging
 import os
 import re
+import shlex
+import shutil
 import subprocess
-import virtualenv
-import venv
+import sys
+import tempfile
+import threading
+import time
 import utils
+from ansible_events import ANSIBLE_EVENTS_ENABLED, AnsibleEvents, get_callback_env
+from ansible_profile import ANSIBLE_CFG, AnsibleProfile
+from env_manager import EnvironmentManager
+from fork_server import FORK_SERVER_ENABLED, ForkServerClient
+from lockfile import Lockfiles
+from manifest import MANIFEST, Manifest
+from metrics import CACHE_REQUESTS, COMMAND_OUTPUT_BYTES, COMMAND_RUN_SECONDS, COMMANDS_IN_FLIGHT, \
+    PREPARE_ENV_PHASE_SECONDS, PREPARE_ENV_SECONDS, TIMEOUTS
+from output_capture import OutputCapture, read_lines, read_lines_async
+from payload_channel import PAYLOAD_FD_ENV, PayloadChannel
+from role_store import RoleStore
+from single_flight import SingleFlight
+from venv_template import VenvTemplate
+from wheelhouse import Wheelhouse
 import proto.CommandExecutor_pb2 as CommandExecutor_pb2
 import email.parser
 import json
 
 REQUIREMENTS_TXT = "requirements.txt"
+PIP = CommandExecutor_pb2.PackageType.Name(CommandExecutor_pb2.pip)
+ANSIBLE_GALAXY = CommandExecutor_pb2.PackageType.Name(CommandExecutor_pb2.ansible_galaxy)
+# Name of a pip requirement, None for the ones pointing at a URL or a path
+PACKAGE_NAME = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*([<>=!~;@ ]|$)')
+BLUEPRINTS_DEPLOY_HOME = utils.BLUEPRINTS_DEPLOY_HOME
+# Python environments are content-addressed by their package set and shared by every blueprint declaring it
+SHARED_ENV_HOME = os.environ.get('CE_SHARED_ENV_HOME', BLUEPRINTS_DEPLOY_HOME + '.envs/')
+VENV_LINKS = ["bin", "include", "lib", "lib64", "pyvenv.cfg"]
+SHARED_ENV_FLIGHTS = SingleFlight()
+PREPARE_ENV_FLIGHTS = SingleFlight()
+# A new blueprint version derives its environment from the one of a previous version rather than building it cold
+ENV_INHERITANCE = os.environ.get('CE_ENV_INHERITANCE', 'true') == "true"
+CDS_UTILS_HOME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cds_utils')
+CDS_UTILS_HASH = utils.get_directory_hash(CDS_UTILS_HOME)
+# Commands without shell syntax are started from their argv, saving a /bin/sh per request
+SHELL_FREE_COMMANDS = os.environ.get('CE_SHELL_FREE_COMMANDS', 'true') == "true"
+# How executeCommand hands the request properties to the command: argv (default), stdin or file
+PROPERTIES_DELIVERY = os.environ.get('CE_PROPERTIES_DELIVERY', 'argv')
+if PROPERTIES_DELIVERY not in ('argv', 'stdin', 'file'):
+    # Checked on startup, a typo would otherwise silently switch every command to stdin
+    raise ValueError("Invalid CE_PROPERTIES_DELIVERY '{}', expected argv|stdin|file".format(PROPERTIES_DELIVERY))
+GALAXY_INSTALL_WORKERS = int(os.environ.get('CE_GALAXY_INSTALL_WORKERS', '4'))
+# Stop commands and installs running past the request timeOut; off by default as clients send a timeOut on every
+# request whether or not they mean it as a limit
+ENFORCE_TIMEOUT = os.environ.get('CE_ENFORCE_TIMEOUT', 'false') == "true"
+WHEELHOUSE = Wheelhouse()
+LOCKFILES = Lockfiles()
+ROLE_STORE = RoleStore()
+VENV_TEMPLATE = VenvTemplate()
+ANSIBLE_PROFILE = AnsibleProfile()
+FORK_SERVERS = {}
+FORK_SERVER_FLIGHTS = SingleFlight()
+ENV_MANAGER = EnvironmentManager(BLUEPRINTS_DEPLOY_HOME, SHARED_ENV_HOME, VENV_LINKS)
+
+
+def _stop_fork_server(venv_home):
+    fork_server = FORK_SERVERS.pop(venv_home, None)
+    if fork_server is not None:
+        fork_server.stop()
+
+
+ENV_MANAGER.eviction_listeners.append(_stop_fork_server)
+
+
+def write_input(stream, data):
+    try:
+        stream.write(data)
+        stream.close()
+    except OSError:
+        # The command exited without reading its input
+        pass
+
+
+async def write_input_async(stream, data):
+    try:
+        stream.write(data)
+        await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+
+def get_package_name(package):
+    match = PACKAGE_NAME.match(package)
+    if match is None or package == REQUIREMENTS_TXT or '://' in package:
+        return None
+    return re.sub(r'[-_.]+', '-', match.group(1)).lower()
+
+
+class CommandOutput:
+    """Sorts the output lines of a command into log lines and the payload sent between the payload markers."""
+
+    def __init__(self, sink, logger):
+        self.sink = sink
+        self.logger = logger
+        self.payload_result = {}
+        self.output_bytes = 0
+        self.is_debug = os.environ.get('CE_DEBUG', 'false') == "true"
+        self._payload_section = []
+        self._is_payload_section = False
+
+    def append(self, output):
+        self.output_bytes += len(output) + 1
+        if output.startswith('BEGIN_EXTRA_PAYLOAD'):
+            self._is_payload_section = True
+        elif output.startswith('END_EXTRA_PAYLOAD'):
+            self._is_payload_section = False
+            payload = '\n'.join(self._payload_section)
+            self._payload_section.clear()
+            msg = email.parser.Parser().parsestr(payload)
+            for part in msg.get_payload():
+                self.payload_result = json.loads(part.get_payload())
+        elif self._is_payload_section:
+            self._payload_section.append(output.strip())
+        elif output.strip():
+            if self.is_debug:
+                self.logger.info(output.strip())
+            self.sink.append(output.strip())
+
+
+class CommandRun:
+    """A command about to be run: how to start it, and where its output and payload go."""
+
+    def __init__(self, cmd, env, properties_input, output):
+        self.cmd = cmd
+        self.env = env
+        self.properties_input = properties_input
+        self.output = output
+        # Payloads sent through the channel skip the MIME encoding and stdout scraping of the marker protocol
+        self.payload_channel = PayloadChannel()
+        self.rc = None
+
+
+def prepare_env(request):
+    # Concurrent requests for the same blueprint wait for the one already installing it and share its outcome
+    def prepare():
+        results = []
+        handler = CommandExecutorHandler(request)
+        start = time.monotonic()
+        success = handler.prepare_env(request, results)
+        PREPARE_ENV_SECONDS.labels("success" if success else "failure").observe(time.monotonic() - start)
+        return success, results, handler.timed_out
+
+    success, results, timed_out = PREPARE_ENV_FLIGHTS.do(utils.get_blueprint_id(request), prepare)
+    return success, list(results), timed_out
 
 
 class CommandExecutorHandler:
@@ -37,49 +185,363 @@ class CommandExecutorHandler:
         self.request = request
         self.logger = logging.getLogger(self.__class__.__name__)
         self.blueprint_id = utils.get_blueprint_id(request)
-        self.venv_home = '/opt/app/onap/blueprints/deploy/' + self.blueprint_id
+        self.venv_home = BLUEPRINTS_DEPLOY_HOME + self.blueprint_id
         self.installed = self.venv_home + '/.installed'
+        self.packages = self.venv_home + '/.packages'
+        self.requirements = self.venv_home + "/Environments/" + REQUIREMENTS_TXT
+        self.roles_path = self.venv_home + "/Scripts/ansible/roles"
+        self.venv_env = MappingProxyType(dict(os.environ))
+        self.deadline = None
+        self.start_deadline()
+        self.timed_out = False
+        self.ansible_events = None
+        # The command process while it runs, for cancel()
+        self.process = None
+        self.cancelled = False
+        self._process_lock = threading.Lock()
 
     def is_installed(self):
-        return os.path.exists(self.installed)
+        # The shared environment the blueprint links to may have been evicted or deleted since it was prepared
+        if not os.path.exists(self.installed):
+            return False
+        bin_dir = self.venv_home + "/bin"
+        return not os.path.islink(bin_dir) or os.path.exists(
+            os.path.join(os.path.dirname(os.path.realpath(bin_dir)), '.installed'))
+
+    def start_deadline(self):
+        # request.timeOut is in seconds, 0 means no limit
+        if ENFORCE_TIMEOUT and self.request.timeOut > 0:
+            self.deadline = time.monotonic() + self.request.timeOut
+
+    def cancel(self):
+        # The client went away: stop the command rather than let it run for nobody
+        with self._process_lock:
+            self.cancelled = True
+            process = self.process
+        if process is not None:
+            self.logger.info("{} - Command cancelled by the client".format(self.blueprint_id))
+            threading.Thread(target=utils.terminate_process_group, args=(process,), daemon=True).start()
 
     def prepare_env(self, request, results):
-        if not self.is_installed():
-            self.create_venv()
-            if not self.activate_venv():
-                return False
+        with ENV_MANAGER.using(self.venv_home):
+            ENV_MANAGER.touch(self.venv_home)
+            env_hash = utils.get_env_hash(request, self.requirements)
+            manifest = Manifest(self.venv_home)
+            roles = self.get_packages(request, CommandExecutor_pb2.ansible_galaxy)
+            if ROLE_STORE.is_enabled():
+                # Roles linked from a store entry that was invalidated since are installed again
+                unlinked = [role for role in manifest.get(ANSIBLE_GALAXY, [])
+                            if role in roles and not ROLE_STORE.is_linked(role, self.roles_path)]
+                if unlinked:
+                    manifest.discard(ANSIBLE_GALAXY, unlinked)
+            is_current = self.is_installed() and manifest.get("env") == env_hash and not manifest.get_missing(
+                ANSIBLE_GALAXY, roles)
+            CACHE_REQUESTS.labels("blueprint_env", "hit" if is_current else "miss").inc()
+            if not is_current:
+                if self.is_installed():
+                    # The packages changed: commands wait for the new environment rather than run in the old one
+                    os.remove(self.installed)
+                # Recorded so an evicted environment can be provisioned again when a command needs it
+                with open(self.packages, "w") as f:
+                    f.write(MessageToJson(request))
+
+                env_home = os.path.join(SHARED_ENV_HOME, env_hash)
+                seed_home = self.get_seed_env(request, manifest.get("env"), env_hash)
+
+                def prepare_shared_env():
+                    env_results = []
+                    return self.prepare_shared_env(request, env_home, seed_home, env_results), env_results, \
+                        self.timed_out
+
+                with ENV_MANAGER.using(*[home for home in (env_home, seed_home) if home]):
+                    # Blueprints sharing the same package set may be prepared concurrently; only one of them builds it
+                    success, env_results, self.timed_out = SHARED_ENV_FLIGHTS.do(env_hash, prepare_shared_env)
+                    results.extend(env_results)
+                    if not success:
+                        return False
+                    if not self.link_venv(env_home):
+                        return False
+                if not self.activate_venv():
+                    return False
+                manifest.set("env", env_hash)
+
+                f = open(self.installed, "w+")
+                self.write_packages(request, CommandExecutor_pb2.pip, f)
+                f.write("\r\n")
+                results.append("\n")
+                if not self.install_packages(request, CommandExecutor_pb2.ansible_galaxy, f, results, manifest):
+                    return False
+                f.close()
+            else:
+                f = open(self.installed, "r")
+                results.append(f.read())
+                f.close()
 
-            f = open(self.installed, "w+")
-            if not self.install_packages(request, CommandExecutor_pb2.pip, f, results):
+        # deactivate_venv(blueprint_id)
+        return True
+
+    def get_seed_env(self, request, previous_hash, env_hash):
+        # The complete shared environment closest to the requested packages, to derive the new one from: the one this
+        # blueprint used before its packages changed, or with inheritance the one of another version of the blueprint
+        seed_hashes = {previous_hash}
+        if ENV_INHERITANCE:
+            seed_hashes.update(Manifest(home).get("env") for home in self.get_other_versions())
+        packages = set(self.get_packages(request, CommandExecutor_pb2.pip))
+        seed_home, seed_distance = None, None
+        for seed_hash in sorted(seed_hashes - {None, env_hash}):
+            home = os.path.join(SHARED_ENV_HOME, seed_hash)
+            if not os.path.exists(home + '/.installed'):
+                continue
+            seed_manifest = Manifest(home)
+            if seed_manifest.get("python") != utils.PYTHON_VERSION:
+                continue
+            distance = len(packages.symmetric_difference(seed_manifest.get(PIP, [])))
+            if seed_home is None or distance < seed_distance:
+                seed_home, seed_distance = home, distance
+        return seed_home
+
+    def get_other_versions(self):
+        blueprint_home = os.path.dirname(self.venv_home)
+        return [home for home in glob.glob(os.path.join(glob.escape(blueprint_home), '*'))
+                if home != self.venv_home and os.path.exists(os.path.join(home, MANIFEST))]
+
+    def get_prepare_request(self):
+        # The prepareEnv request recorded for this blueprint, None when the blueprint was never prepared
+        if not os.path.exists(self.packages):
+            return None
+        with open(self.packages) as f:
+            return Parse(f.read(), CommandExecutor_pb2.PrepareEnvInput())
+
+    def prepare_shared_env(self, request, env_home, seed_home, results):
+        env_installed = env_home + '/.installed'
+        CACHE_REQUESTS.labels("shared_env", "hit" if os.path.exists(env_installed) else "miss").inc()
+        if os.path.exists(env_installed):
+            self.logger.info("{} - Reusing shared Python Virtual Environment {}".format(self.blueprint_id, env_home))
+            results.append("Reusing shared environment %s\n" % os.path.basename(env_home))
+            return self.update_utilities(env_home, Manifest(env_home), results)
+
+        manifest = Manifest(env_home)
+        if manifest.get("python") == utils.PYTHON_VERSION and os.path.exists(env_home + "/bin/python"):
+            # An earlier prepareEnv stopped half way, keep what it already installed
+            self.logger.info("{} - Resuming shared Python Virtual Environment {}".format(self.blueprint_id, env_home))
+            results.append("Resuming shared environment %s\n" % os.path.basename(env_home))
+            if not self.activate_venv(env_home):
                 return False
-            f.write("\r\n")
-            results.append("\n")
-            if not self.install_packages(request, CommandExecutor_pb2.ansible_galaxy, f, results):
+        elif seed_home is not None and self.derive_venv(seed_home, env_home):
+            results.append("Deriving shared environment %s from %s\n" % (os.path.basename(env_home),
+                                                                         os.path.basename(seed_home)))
+            manifest = Manifest(env_home)
+            if not self.activate_venv(env_home):
                 return False
-            f.close()
         else:
-            f = open(self.installed, "r")
-            results.append(f.read())
-            f.close()
+            self.create_venv(env_home)
+            manifest = Manifest(env_home)
+            if not self.activate_venv(env_home):
+                return False
+            # From here on the environment is worth resuming rather than rebuilding
+            manifest.set("python", utils.PYTHON_VERSION)
 
-        # deactivate_venv(blueprint_id)
+        # Resumed and derived environments carry the cds_utils of the executor that built them, if any
+        if not self.update_utilities(env_home, manifest, results):
+            return False
+        packages = self.get_packages(request, CommandExecutor_pb2.pip)
+        if not self.uninstall_python_packages(packages, manifest, results):
+            return False
+        requirements_hash = utils.get_requirements_hash(self.requirements)
+        if manifest.get("requirements") != requirements_hash:
+            manifest.discard(PIP, [REQUIREMENTS_TXT])
+            manifest.set("requirements", requirements_hash)
+
+        env_hash = os.path.basename(env_home)
+        if LOCKFILES.is_enabled() and manifest.get_missing(PIP, packages):
+            locked = LOCKFILES.is_locked(env_hash) and self.install_locked_packages(env_hash, packages, results)
+            CACHE_REQUESTS.labels("lock", "hit" if locked else "miss").inc()
+            if locked:
+                manifest.add(PIP, packages)
+
+        # The marker is only published once every package is in, so a crash never leaves a half-built env behind it
+        f = open(env_installed + '.tmp', "w+")
+        if not self.install_packages(request, CommandExecutor_pb2.pip, f, results, manifest):
+            return False
+        f.close()
+        if LOCKFILES.is_enabled() and not LOCKFILES.is_locked(env_hash):
+            self.lock_packages(env_hash)
+        os.rename(f.name, env_installed)
         return True
 
     def execute_command(self, request, results):
+        with ENV_MANAGER.using(self.venv_home):
+            ENV_MANAGER.touch(self.venv_home)
+            if not self.is_installed():
+                if not self.reprovision(results):
+                    return {"cds_return_code": 1}
+                # The command gets its whole timeOut, however long the re-provisioning took
+                self.start_deadline()
+            return self.run_command(request, results)
+
+    async def execute_command_async(self, request, results, executor):
+        # Provisioning stays blocking and runs on the executor, only the command itself is driven by the event loop
+        with ENV_MANAGER.using(self.venv_home):
+            ENV_MANAGER.touch(self.venv_home)
+            if not self.is_installed():
+                reprovisioned = await asyncio.get_event_loop().run_in_executor(executor, self.reprovision, results)
+                if not reprovisioned:
+                    return {"cds_return_code": 1}
+                self.start_deadline()
+            return await self.run_command_async(request, results)
 
-        if not self.activate_venv():
+    def reprovision(self, results):
+        # The environment was evicted since it was last used, provision it again from its recorded prepareEnv
+        prepare_request = self.get_prepare_request()
+        if prepare_request is None:
             return False
+        self.logger.info("{} - Re-provisioning evicted Python Virtual Environment".format(self.blueprint_id))
+        success, prepare_results, _ = prepare_env(prepare_request)
+        if not success:
+            results.extend(prepare_results)
+        return success
 
-        cmd = "cd " + self.venv_home
+    def run_command(self, request, results):
+        if not self.activate_command_venv(results):
+            return {"cds_return_code": 1}
 
-        if "ansible-playbook" in request.command:
-            cmd = cmd + "; " + request.command + " -e 'ansible_python_interpreter=" + self.venv_home + "/bin/python'"
-        else:
-            cmd = cmd + "; " + request.command + " " + re.escape(MessageToJson(request.properties))
+        with self.command_run(request, results) as run:
+
+            def on_timeout():
+                self.logger.info("{} - Command timed out after {} seconds".format(self.blueprint_id, request.timeOut))
+                self.timed_out = True
+                utils.terminate_process_group(newProcess)
+
+            timer = None
+            try:
+                with self.spawn_command(run.cmd, request, run.env, run.payload_channel.write_fd,
+                                        run.properties_input is not None) as newProcess:
+                    with self._process_lock:
+                        self.process = newProcess
+                    if self.cancelled:
+                        self.cancel()
+                    run.payload_channel.start()
+                    if run.properties_input is not None:
+                        threading.Thread(target=write_input, args=(newProcess.stdin, run.properties_input),
+                                         daemon=True).start()
+                    if self.deadline is not None:
+                        timer = threading.Timer(self.get_remaining_time(), on_timeout)
+                        timer.start()
+                    read_lines(newProcess.stdout, run.output.append, newProcess)
+                    run.rc = newProcess.wait()
+                    # The command is over, whatever it left running in the background does not make it time out
+                    if timer is not None:
+                        timer.cancel()
+                channel_payload = run.payload_channel.get_payload()
+            except Exception as e:
+                return self.command_failed(e, results, run.output)
+            finally:
+                with self._process_lock:
+                    self.process = None
+                if timer is not None:
+                    timer.cancel()
+
+        # deactivate_venv(blueprint_id)
+
+        return self.get_payload_result(request, results, run.output, channel_payload, run.rc)
+
+    async def run_command_async(self, request, results):
+        # Same as run_command, driven by the event loop so a running command does not hold a thread
+        if not self.activate_command_venv(results):
+            return {"cds_return_code": 1}
+
+        loop = asyncio.get_event_loop()
+        with self.command_run(request, results) as run:
+            process = None
+            timer = None
+            try:
+                if isinstance(run.cmd, str):
+                    spawn, args = asyncio.create_subprocess_shell, [run.cmd]
+                else:
+                    spawn, args = asyncio.create_subprocess_exec, run.cmd
+                process = await spawn(
+                    *args, stdin=subprocess.PIPE if run.properties_input is not None else None,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True, cwd=self.venv_home,
+                    env={**run.env, PAYLOAD_FD_ENV: str(run.payload_channel.write_fd)},
+                    pass_fds=(run.payload_channel.write_fd,))
+                run.payload_channel.start(loop)
+                if run.properties_input is not None:
+                    asyncio.ensure_future(write_input_async(process.stdin, run.properties_input))
+                if self.deadline is not None:
+                    timer = loop.call_later(self.get_remaining_time(), self.on_timeout_async, request, process)
+                await read_lines_async(process.stdout, run.output.append, getattr(results, 'drain', None), process)
+                run.rc = await process.wait()
+                if timer is not None:
+                    timer.cancel()
+                channel_payload = await run.payload_channel.get_payload_async()
+            except asyncio.CancelledError:
+                # The client went away, the command has nobody left to report to
+                if process is not None and process.returncode is None:
+                    await utils.terminate_process_group_async(process)
+                raise
+            except Exception as e:
+                return self.command_failed(e, results, run.output)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+        return self.get_payload_result(request, results, run.output, channel_payload, run.rc)
 
-        payload_result = {}
-        payload_section = []
-        is_payload_section = False
+    def activate_command_venv(self, results):
+        if self.activate_venv():
+            return True
+        results.append("Python Virtual Environment of %s is missing, prepare it again" % self.blueprint_id)
+        return False
+
+    @contextmanager
+    def command_run(self, request, results):
+        # What run_command and run_command_async share: the command to start and where its output and payload go,
+        # then the cleanup and metrics once it is over, however it ended
+        cmd, updated_env, properties_input, properties_file = self.get_command(request)
+        # Streaming consumers take the lines as they come, a plain results list only keeps a bounded head and tail
+        capture = OutputCapture(results, request.requestId or "command") if isinstance(results, list) else None
+        run = CommandRun(cmd, updated_env, properties_input, CommandOutput(capture or results, self.logger))
+        started = self.start_command()
+        try:
+            yield run
+        finally:
+            run.payload_channel.close()
+            if capture is not None:
+                capture.close()
+            if properties_file is not None:
+                os.remove(properties_file)
+            if self.ansible_events is not None:
+                self.ansible_events.close()
+            self.end_command(started, run.output, run.rc)
+
+    def command_failed(self, err, results, output):
+        self.logger.info("{} - Failed to execute command. Error: {}".format(self.blueprint_id, err))
+        results.append(err)
+        return {**output.payload_result, "cds_return_code": False}
+
+    def on_timeout_async(self, request, process):
+        self.logger.info("{} - Command timed out after {} seconds".format(self.blueprint_id, request.timeOut))
+        self.timed_out = True
+        asyncio.ensure_future(utils.terminate_process_group_async(process))
+
+    def get_command(self, request):
+        # Returns the command to start, its environment and how the request properties are handed over to it. The
+        # command is an argv started without any shell when it has no shell syntax, a shell command line otherwise.
+        properties_env = {}
+        properties_input = None
+        properties_file = None
+
+        if "ansible-playbook" not in request.command and PROPERTIES_DELIVERY != 'argv':
+            # Compact JSON handed over out of band: no pretty-printing, escaping, shell parsing or ARG_MAX limit
+            properties = json.dumps(MessageToDict(request.properties), separators=(',', ':'))
+            properties_env['CDS_PROPERTIES_DELIVERY'] = PROPERTIES_DELIVERY
+            if PROPERTIES_DELIVERY == 'file':
+                fd, properties_file = tempfile.mkstemp(prefix='cds-properties-', suffix='.json')
+                with os.fdopen(fd, 'w') as f:
+                    f.write(properties)
+                properties_env['CDS_PROPERTIES_FILE'] = properties_file
+            else:
+                properties_input = properties.encode()
 
         ### extract the original header request into sys-env variables
         ### RequestID
@@ -87,131 +549,479 @@ class CommandExecutorHandler:
         ### Sub-requestID
         subrequest_id = request.correlationId
         request_id_map = {'CDS_REQUEST_ID':request_id, 'CDS_CORRELATION_ID':subrequest_id}
-        updated_env =  { **os.environ, **request_id_map }
+        updated_env =  { **self.venv_env, **request_id_map, **properties_env }
+        if "ansible-playbook" in request.command:
+            ANSIBLE_PROFILE.apply(self.venv_home)
+            if ANSIBLE_EVENTS_ENABLED:
+                self.ansible_events = AnsibleEvents()
+                updated_env.update(self.ansible_events.get_env(updated_env))
+
+        argv = self.get_argv(request) if SHELL_FREE_COMMANDS else None
+        # Commands that cannot be found are left to the shell, which reports them as usual
+        if argv is not None and self.find_executable(argv[0]) is not None:
+            return argv, updated_env, properties_input, properties_file
+
+        cmd = "cd " + self.venv_home
+        if "ansible-playbook" in request.command:
+            cmd = cmd + "; " + request.command + " -e 'ansible_python_interpreter=" + self.venv_home + "/bin/python'"
+        elif PROPERTIES_DELIVERY == 'argv':
+            cmd = cmd + "; " + request.command + " " + re.escape(MessageToJson(request.properties))
+        else:
+            cmd = cmd + "; " + request.command
+        return cmd, updated_env, properties_input, properties_file
 
+    def get_argv(self, request):
+        # The command and its arguments when it has no shell syntax to interpret, None otherwise
+        if utils.has_shell_syntax(request.command):
+            return None
         try:
-            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                  shell=True, bufsize=1, universal_newlines=True, env=updated_env) as newProcess:
-                while True:
-                    output = newProcess.stdout.readline()
-                    if output == '' and newProcess.poll() is not None:
-                        break
-                    if output.startswith('BEGIN_EXTRA_PAYLOAD'):
-                        is_payload_section = True
-                        output = newProcess.stdout.readline()
-                    if output.startswith('END_EXTRA_PAYLOAD'):
-                        is_payload_section = False
-                        output = ''
-                        payload = '\n'.join(payload_section)
-                        msg = email.parser.Parser().parsestr(payload)
-                        for part in msg.get_payload():
-                            payload_result = json.loads(part.get_payload())
-                    if output and not is_payload_section:
-                        self.logger.info(output.strip())
-                        results.append(output.strip())
-                    else:
-                        payload_section.append(output.strip())
-                rc = newProcess.poll()
-        except Exception as e:
-            self.logger.info("{} - Failed to execute command. Error: {}".format(self.blueprint_id, e))
-            results.append(e)
-            payload_result["cds_return_code"] = False
-            return payload_result
+            argv = shlex.split(request.command)
+        except ValueError:
+            return None
+        if not argv:
+            return None
+        if "ansible-playbook" in request.command:
+            argv += ["-e", "ansible_python_interpreter=" + self.venv_home + "/bin/python"]
+        elif PROPERTIES_DELIVERY == 'argv':
+            argv.append(MessageToJson(request.properties))
+        return argv
 
-        # deactivate_venv(blueprint_id)
+    def find_executable(self, name):
+        if '/' in name:
+            path = os.path.join(self.venv_home, name)
+            return path if os.path.isfile(path) and os.access(path, os.X_OK) else None
+        return shutil.which(name, path=self.venv_env.get('PATH'))
 
+    def start_command(self):
+        COMMANDS_IN_FLIGHT.labels(self.blueprint_id).inc()
+        return time.monotonic()
+
+    def end_command(self, started, output, rc):
+        COMMANDS_IN_FLIGHT.labels(self.blueprint_id).dec()
+        if self.timed_out:
+            status = "timeout"
+            TIMEOUTS.labels("command").inc()
+        else:
+            status = "success" if rc == 0 else "failure"
+        COMMAND_RUN_SECONDS.labels(status).observe(time.monotonic() - started)
+        COMMAND_OUTPUT_BYTES.observe(output.output_bytes)
+
+    def get_payload_result(self, request, results, output, channel_payload, rc):
+        payload_result = channel_payload if channel_payload is not None else output.payload_result
+        if self.ansible_events is not None and self.ansible_events.results is not None:
+            payload_result.setdefault("ansible", self.ansible_events.results)
+        if self.timed_out:
+            results.append("Command timed out after %s seconds" % request.timeOut)
+            payload_result["cds_timed_out"] = True
         payload_result["cds_return_code"] = rc
         return payload_result
 
-    def install_packages(self, request, type, f, results):
-        success = self.install_python_packages('UTILITY', results)
+    def spawn_command(self, cmd, request, env, payload_fd, with_input=False):
+        fork_command = None if with_input else self.get_fork_command(request)
+        if fork_command is not None:
+            try:
+                script, argv = fork_command
+                fork_server = FORK_SERVER_FLIGHTS.do(self.venv_home, self.get_fork_server)
+                self.logger.info("{} - Forking {} from the fork server".format(self.blueprint_id, script))
+                return fork_server.spawn(script, argv, self.venv_home, env, payload_fd)
+            except Exception as err:
+                self.logger.info("{} - Fork server unavailable, falling back to a new process. Error: {}".format(
+                    self.blueprint_id, err))
+
+        # No preexec_fn, so the interpreter can spawn with vfork or posix_spawn where it supports them
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True,
+                                stdin=subprocess.PIPE if with_input else None, shell=isinstance(cmd, str),
+                                cwd=self.venv_home, env={**env, PAYLOAD_FD_ENV: str(payload_fd)},
+                                pass_fds=(payload_fd,))
+
+    def get_fork_command(self, request):
+        # Only commands running a Python script of the venv, without any shell syntax, can be run by the fork server
+        if not FORK_SERVER_ENABLED:
+            return None
+        argv = self.get_argv(request)
+        if argv is None:
+            return None
+
+        if argv[0] in ("python", "python3"):
+            if len(argv) < 2 or argv[1].startswith('-'):
+                return None
+            return argv[1], argv[1:]
+
+        path = self.find_executable(argv[0])
+        if path is None or not path.startswith(self.venv_home + "/bin/"):
+            return None
+        try:
+            with open(path, "rb") as f:
+                shebang = f.readline()
+        except OSError:
+            return None
+        if not shebang.startswith(b"#!") or b"python" not in shebang:
+            return None
+        return path, [path] + argv[1:]
+
+    def get_fork_server(self):
+        fork_server = FORK_SERVERS.get(self.venv_home)
+        fingerprint = self.get_fork_fingerprint()
+        if fork_server is not None and fork_server.is_alive() and fork_server.fingerprint == fingerprint:
+            return fork_server
+        if fork_server is not None:
+            fork_server.stop()
+        fork_server = ForkServerClient(self.venv_home, self.get_fork_env(), fingerprint)
+        FORK_SERVERS[self.venv_home] = fork_server
+        return fork_server
+
+    def get_fork_fingerprint(self):
+        # What the preloaded modules were imported from: the packages installed, the environment, and the ansible.cfg
+        # ansible reads once on import. A server started before any of them changed is restarted.
+        def get_mtime(path):
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+
+        ansible_cfg = self.venv_env.get('ANSIBLE_CONFIG') or os.path.join(self.venv_home, ANSIBLE_CFG)
+        return (os.path.realpath(self.venv_home + "/bin"), get_mtime(self.installed), get_mtime(ansible_cfg),
+                self.get_fork_env())
+
+    def get_fork_env(self):
+        # The ansible settings are read once on import, so the events callback is enabled in the server itself rather
+        # than per command; the commands only name their events file
+        env = dict(self.venv_env)
+        if ANSIBLE_EVENTS_ENABLED:
+            env.update(get_callback_env(env))
+        return env
 
+    def get_packages(self, request, type):
+        packages = []
+        for package in request.packages:
+            if package.type == type:
+                packages.extend(package.package)
+        return packages
+
+    def write_packages(self, request, type, f):
         for package in request.packages:
             if package.type == type:
                 f.write("Installed %s packages:\r\n" % CommandExecutor_pb2.PackageType.Name(type))
                 for p in package.package:
                     f.write("   %s\r\n" % p)
-                    if package.type == CommandExecutor_pb2.pip:
-                        success = self.install_python_packages(p, results)
-                    else:
-                        success = self.install_ansible_packages(p, results)
-                    if not success:
-                        f.close()
-                        os.remove(self.installed)
-                        return False
+
+    def install_packages(self, request, type, f, results, manifest):
+        self.write_packages(request, type, f)
+        # Only what the manifest does not list yet, a re-run installs the difference or picks up where it failed
+        packages = manifest.get_missing(CommandExecutor_pb2.PackageType.Name(type), self.get_packages(request, type))
+
+        with PREPARE_ENV_PHASE_SECONDS.labels(CommandExecutor_pb2.PackageType.Name(type)).time():
+            if type == CommandExecutor_pb2.pip:
+                success = self.install_python_packages(packages, results, manifest)
+            else:
+                success = self.install_ansible_packages(packages, results, manifest)
+        if not success:
+            f.close()
+            os.remove(f.name)
+            return False
         return True
 
-    def install_python_packages(self, package, results):
+    def update_utilities(self, env_home, manifest, results):
+        if manifest.get("utilities") == CDS_UTILS_HASH:
+            return True
+        if not self.install_utilities(env_home, results):
+            return False
+        manifest.set("utilities", CDS_UTILS_HASH)
+        return True
+
+    def install_utilities(self, env_home, results):
+        # Environments are created by the interpreter running the executor
+        site_packages = env_home + "/lib/python%s.%s/site-packages" % sys.version_info[:2]
+        # Copied aside then swapped in, never written in place: a derived environment shares the files of its seed
+        # through hardlinks
+        tmp = tempfile.mkdtemp(prefix='.cds_utils.', dir=site_packages)
+        try:
+            shutil.copytree(CDS_UTILS_HOME, os.path.join(tmp, 'cds_utils'),
+                            ignore=shutil.ignore_patterns('__pycache__'))
+            target = os.path.join(site_packages, 'cds_utils')
+            if os.path.lexists(target):
+                os.rename(target, os.path.join(tmp, 'previous'))
+            os.rename(os.path.join(tmp, 'cds_utils'), target)
+        except OSError as err:
+            self.logger.info("{} - Failed to install cds_utils. Error: {}".format(self.blueprint_id, err))
+            results.append("Failed to install cds_utils: %s\n" % err)
+            return False
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return True
+
+    def install_python_packages(self, packages, results, manifest):
+        if not packages:
+            return True
         self.logger.info(
-            "{} - Install Python package({}) in Python Virtual Environment".format(self.blueprint_id, package))
+            "{} - Install Python packages({}) in Python Virtual Environment".format(self.blueprint_id,
+                                                                                   ', '.join(packages)))
 
-        if REQUIREMENTS_TXT == package:
-            command = ["pip", "install", "-r", self.venv_home + "/Environments/" + REQUIREMENTS_TXT]
-        elif package == 'UTILITY':
-            command = ["cp", "-r", "./cds_utils", self.venv_home + "/lib/python3.6/site-packages/"]
-        else:
-            command = ["pip", "install", package]
+        env = self.get_pip_env()
 
-        env = dict(os.environ)
+        # A single pip invocation resolves the whole set at once; only when it fails are the packages retried one
+        # by one, so the response log still points at the package that broke the installation.
+        if self.pip_install(packages, env, results):
+            manifest.add(PIP, packages)
+            return True
+        if len(packages) == 1:
+            results.append("Failed to install pip package %s\n" % packages[0])
+            return False
+        self.logger.info("{} - Batched pip install failed, installing packages one by one".format(self.blueprint_id))
+        for package in packages:
+            if not self.pip_install([package], env, results):
+                results.append("Failed to install pip package %s\n" % package)
+                return False
+            manifest.add(PIP, [package])
+        return True
+
+    def install_locked_packages(self, env_hash, packages, results):
+        # The exact versions resolved when this package set was first installed, with the resolver out of the way
+        lock = LOCKFILES.get_path(env_hash)
+        self.logger.info("{} - Install Python packages from lock {}".format(self.blueprint_id, lock))
+        lock_results = []
+        if self.pip_install(packages, self.get_pip_env(), lock_results, ["--no-deps", "-r", lock]):
+            results.extend(lock_results)
+            return True
+        # A lock that cannot be replayed here, e.g. wheels built from sources on another replica, is only a miss
+        self.logger.info("{} - Failed to install from lock {}, resolving packages. Error: {}".format(
+            self.blueprint_id, lock, ''.join(lock_results).strip()))
+        return False
+
+    def lock_packages(self, env_hash):
+        try:
+            freeze = subprocess.run(["pip", "freeze", "--local"], stdout=PIPE, stderr=PIPE, env=self.venv_env,
+                                    check=True, timeout=self.get_remaining_time()).stdout.decode()
+            LOCKFILES.save(env_hash, freeze, WHEELHOUSE)
+        except Exception as err:
+            self.logger.info("{} - Failed to lock Python packages. Error: {}".format(self.blueprint_id, err))
+
+    def uninstall_python_packages(self, packages, manifest, results):
+        # Packages a derived environment inherited but is no longer asked for; a package whose version changed is
+        # left to pip install to replace
+        removed = [p for p in manifest.get(PIP, []) if p not in packages]
+        if not removed:
+            return True
+        requested = set(get_package_name(p) for p in packages)
+        names = sorted(set(get_package_name(p) for p in removed) - requested - {None})
+        if names:
+            self.logger.info("{} - Uninstall Python packages({})".format(self.blueprint_id, ', '.join(names)))
+            if not self.run_install(["pip", "uninstall", "-y"] + names, dict(self.venv_env), results):
+                return False
+        manifest.discard(PIP, removed)
+        return True
+
+    def get_pip_env(self):
+        env = dict(self.venv_env)
         if "https_proxy" in os.environ:
             env['https_proxy'] = os.environ['https_proxy']
+        return env
 
-        try:
-            results.append(subprocess.run(command, check=True, stdout=PIPE, stderr=PIPE, env=env).stdout.decode())
-            results.append("\n")
+    def pip_install(self, packages, env, results, pip_args=None):
+        if pip_args is None:
+            pip_args = self.get_pip_args(packages)
+        if not WHEELHOUSE.is_enabled():
+            return self.run_install(["pip", "install"] + pip_args, env, results)
+
+        cached_results = []
+        with WHEELHOUSE.usage.shared(self.get_remaining_time()) as acquired:
+            if not acquired:
+                return self.on_wait_timeout("the wheelhouse", results)
+            installed = self.run_install(WHEELHOUSE.get_install_command(pip_args), env, cached_results)
+        if installed:
+            CACHE_REQUESTS.labels("wheelhouse", "hit").inc()
+            results.extend(cached_results)
+            WHEELHOUSE.touch(packages)
             return True
-        except CalledProcessError as e:
-            results.append(e.stderr.decode())
+        CACHE_REQUESTS.labels("wheelhouse", "miss").inc()
+        if WHEELHOUSE.offline:
+            results.extend(cached_results)
             return False
 
-    def install_ansible_packages(self, package, results):
+        self.logger.info("{} - Filling wheelhouse with ({})".format(self.blueprint_id, ', '.join(packages)))
+        with WHEELHOUSE.filling(pip_args, self.get_remaining_time()) as acquired:
+            if not acquired:
+                return self.on_wait_timeout("the wheelhouse fill of the same packages", results)
+            with WHEELHOUSE.usage.shared(self.get_remaining_time()) as acquired:
+                if not acquired:
+                    return self.on_wait_timeout("the wheelhouse", results)
+                if not self.run_install(WHEELHOUSE.get_fill_command(pip_args), env, results):
+                    return False
+                success = self.run_install(WHEELHOUSE.get_install_command(pip_args), env, results)
+        WHEELHOUSE.evict(self.get_remaining_time())
+        return success
+
+    def get_pip_args(self, packages):
+        pip_args = []
+        for package in packages:
+            if REQUIREMENTS_TXT == package:
+                pip_args += ["-r", self.venv_home + "/Environments/" + REQUIREMENTS_TXT]
+            else:
+                pip_args.append(package)
+        return pip_args
+
+    def install_ansible_packages(self, packages, results, manifest):
+        if not packages:
+            return True
         self.logger.info(
-            "{} - Install Ansible Role package({}) in Python Virtual Environment".format(self.blueprint_id, package))
-        command = ["ansible-galaxy", "install", package, "-p", self.venv_home + "/Scripts/ansible/roles"]
+            "{} - Install Ansible Role packages({}) in Python Virtual Environment".format(self.blueprint_id,
+                                                                                         ', '.join(packages)))
 
-        env = dict(os.environ)
+        env = dict(self.venv_env)
         if "http_proxy" in os.environ:
             # ansible galaxy uses https_proxy environment variable, but requires it to be set with http proxy value.
             env['https_proxy'] = os.environ['http_proxy']
 
-        try:
-            results.append(subprocess.run(command, check=True, stdout=PIPE, stderr=PIPE, env=env).stdout.decode())
-            results.append("\n")
-            return True
-        except CalledProcessError as e:
-            results.append(e.stderr.decode())
+        roles_path = self.roles_path
+
+        def install(package):
+            package_results = []
+            if not ROLE_STORE.is_enabled():
+                command = ["ansible-galaxy", "install", package, "-p", roles_path]
+                return self.run_install(command, env, package_results), package_results
+
+            is_stored = ROLE_STORE.is_stored(package)
+            CACHE_REQUESTS.labels("role_store", "hit" if is_stored else "miss").inc()
+            try:
+                if not ROLE_STORE.fill(package, lambda path: self.run_install(
+                        ["ansible-galaxy", "install", package, "-p", path], env, package_results)):
+                    return False, package_results
+                ROLE_STORE.link(package, roles_path)
+            except OSError as err:
+                package_results.append("Failed to link ansible_galaxy package %s. Error: %s\n" % (package, err))
+                return False, package_results
+            if is_stored:
+                package_results.append("Linked ansible_galaxy package %s from the role store\n" % package)
+            return True, package_results
+
+        # Role downloads are network bound, fetch them concurrently and report them in the requested order. Without
+        # the store they all extract into the same roles path, where roles sharing a dependency would race on it.
+        workers = GALAXY_INSTALL_WORKERS if ROLE_STORE.is_enabled() else 1
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            installs = list(executor.map(install, packages))
+
+        success = True
+        for package, (installed, package_results) in zip(packages, installs):
+            results.extend(package_results)
+            if not installed:
+                results.append("Failed to install ansible_galaxy package %s\n" % package)
+                success = False
+            else:
+                manifest.add(ANSIBLE_GALAXY, [package])
+        return success
+
+    def run_install(self, command, env, results):
+        with subprocess.Popen(command, stdout=PIPE, stderr=PIPE, env=env, start_new_session=True) as process:
+            try:
+                stdout, stderr = process.communicate(timeout=self.get_remaining_time())
+            except subprocess.TimeoutExpired:
+                self.logger.info("{} - Timed out running {}".format(self.blueprint_id, ' '.join(command)))
+                utils.terminate_process_group(process)
+                stdout, stderr = process.communicate()
+                self.timed_out = True
+                TIMEOUTS.labels("install").inc()
+                results.append(stderr.decode())
+                results.append("Timed out after %s seconds running: %s\n" % (self.request.timeOut, ' '.join(command)))
+                return False
+
+        if process.returncode != 0:
+            results.append(stderr.decode())
             return False
+        results.append(stdout.decode())
+        results.append("\n")
+        return True
+
+    def on_wait_timeout(self, what, results):
+        self.logger.info("{} - Timed out waiting for {}".format(self.blueprint_id, what))
+        self.timed_out = True
+        TIMEOUTS.labels("install").inc()
+        results.append("Timed out after %s seconds waiting for %s\n" % (self.request.timeOut, what))
+        return False
+
+    def get_remaining_time(self):
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
 
-    def create_venv(self):
-        self.logger.info("{} - Create Python Virtual Environment".format(self.blueprint_id))
+    def create_venv(self, env_home):
+        self.logger.info("{} - Create Python Virtual Environment in {}".format(self.blueprint_id, env_home))
         try:
-            bin_dir = self.venv_home + "/bin"
-            # venv doesn't populate the activate_this.py script, hence we use from virtualenv
-            venv.create(self.venv_home, with_pip=True, system_site_packages=True)
-            virtualenv.writefile(os.path.join(bin_dir, "activate_this.py"), virtualenv.ACTIVATE_THIS)
+            with PREPARE_ENV_PHASE_SECONDS.labels("venv").time():
+                VENV_TEMPLATE.materialize(env_home)
         except Exception as err:
             self.logger.info(
                 "{} - Failed to provision Python Virtual Environment. Error: {}".format(self.blueprint_id, err))
 
-    def activate_venv(self):
-        self.logger.info("{} - Activate Python Virtual Environment".format(self.blueprint_id))
-
-        # Fix: The python generated activate_this.py script concatenates the env bin dir to PATH on every call
-        #      eventually this process PATH variable was so big (128Kb) that no child process could be spawn
-        #      This script will remove all duplicates; while keeping the order of the PATH folders
-        fixpathenvvar = "os.environ['PATH']=os.pathsep.join(list(dict.fromkeys(os.environ['PATH'].split(':'))))"
+    def derive_venv(self, seed_home, env_home):
+        self.logger.info("{} - Derive Python Virtual Environment {} from {}".format(self.blueprint_id, env_home,
+                                                                                   seed_home))
+        try:
+            with PREPARE_ENV_PHASE_SECONDS.labels("venv").time():
+                VENV_TEMPLATE.derive(seed_home, env_home)
+            return True
+        except Exception as err:
+            self.logger.info(
+                "{} - Failed to derive Python Virtual Environment. Error: {}".format(self.blueprint_id, err))
+            return False
 
-        path = "%s/bin/activate_this.py" % self.venv_home
+    def link_venv(self, env_home):
+        # The blueprint only gets symlinks to the shared environment; interpreters resolve their prefix from the
+        # un-resolved executable path, so the environment still behaves as if it lived in the blueprint directory.
+        self.logger.info("{} - Link Python Virtual Environment {}".format(self.blueprint_id, env_home))
+        # Only a venv built in the blueprint directory itself, before environments were shared, is replaced; any
+        # other bin, lib or include directory is blueprint content and is never deleted
+        venv_cfg = os.path.join(self.venv_home, "pyvenv.cfg")
+        is_venv = os.path.isfile(venv_cfg) and not os.path.islink(venv_cfg)
         try:
-            exec (open(path).read(), {'__file__': path})
-            exec (fixpathenvvar)
-            self.logger.info("Running with PATH : {}".format(os.environ['PATH']))
+            for name in VENV_LINKS:
+                target = os.path.join(env_home, name)
+                link = os.path.join(self.venv_home, name)
+                if not os.path.lexists(target):
+                    continue
+                if os.path.islink(link):
+                    if os.readlink(link) == target:
+                        continue
+                    os.remove(link)
+                elif os.path.lexists(link):
+                    if not is_venv:
+                        self.logger.info(
+                            "{} - Failed to link Python Virtual Environment. Error: {} is not part of a virtual "
+                            "environment".format(self.blueprint_id, link))
+                        return False
+                    if os.path.isdir(link):
+                        shutil.rmtree(link)
+                    else:
+                        os.remove(link)
+                os.symlink(target, link)
             return True
         except Exception as err:
             self.logger.info(
-                "{} - Failed to activate Python Virtual Environment. Error: {}".format(self.blueprint_id, err))
+                "{} - Failed to link Python Virtual Environment. Error: {}".format(self.blueprint_id, err))
+            return False
+
+    def activate_venv(self, env_home=None):
+        # Activation only builds the environment handed to this request's child processes. The server's own
+        # os.environ and sys.path are shared by every gRPC worker thread and are never modified.
+        self.logger.info("{} - Activate Python Virtual Environment".format(self.blueprint_id))
+        if env_home is None:
+            env_home = self.venv_home
+
+        bin_dir = env_home + "/bin"
+        if not os.path.exists(bin_dir + "/python"):
+            self.logger.info(
+                "{} - Failed to activate Python Virtual Environment. Error: {} is missing".format(self.blueprint_id,
+                                                                                                bin_dir + "/python"))
             return False
 
+        env = dict(os.environ)
+        env.pop('PYTHONHOME', None)
+        env['VIRTUAL_ENV'] = env_home
+        env['PATH'] = os.pathsep.join([bin_dir] + [p for p in os.environ.get('PATH', '').split(os.pathsep)
+                                                   if p and p != bin_dir])
+        self.venv_env = MappingProxyType(env)
+        self.logger.info("{} - Running with PATH : {}".format(self.blueprint_id, env['PATH']))
+        return True
+
     def deactivate_venv(self):
         self.logger.info("{} - Deactivate Python Virtual Environment".format(self.blueprint_id))
         command = ["deactivate"]
@@ -15,11 +15,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+from concurrent import futures
 import logging
 import os, sys
+import threading
+import time
+import grpc
+import proto.CommandExecutor_pb2 as CommandExecutor_pb2
 import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
 
-from command_executor_handler import CommandExecutorHandler
+from admission import AdmissionController, AdmissionRejected
+from metrics import ADMISSION_REJECTED, CACHE_REQUESTS, COMMAND_QUEUE_WAIT_SECONDS
+from command_executor_handler import CommandExecutorHandler, prepare_env
+from output_stream import OutputStream
+from result_cache import ResultCache
 import utils
 
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
@@ -29,36 +38,135 @@ class CommandExecutorServer(CommandExecutor_pb2_grpc.CommandExecutorServiceServi
 
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.admission = AdmissionController()
+        self.results = ResultCache()
 
     def prepareEnv(self, request, context):
         blueprint_id = utils.get_blueprint_id(request)
         self.logger.info("{} - Received prepareEnv request".format(blueprint_id))
         self.logger.info(request)
 
-        results = []
-        handler = CommandExecutorHandler(request)
-        if not handler.prepare_env(request, results):
-            self.logger.info("{} - Failed to prepare python environment. {}".format(blueprint_id, results))
-            return utils.build_response(request, results, {}, False)
-        self.logger.info("{} - Package installation logs {}".format(blueprint_id, results))
-        return utils.build_response(request, results, {}, True)
+        success, results, timed_out = prepare_env(request)
+        return self.prepare_env_response(blueprint_id, request, success, results, timed_out)
 
     def executeCommand(self, request, context):
-        blueprint_id = utils.get_blueprint_id(request)
-        self.logger.info("{} - Received executeCommand request".format(blueprint_id))
-        if os.environ.get('CE_DEBUG','false') == "true":
-            self.logger.info(request)
+        blueprint_id = self.received(request, "executeCommand")
+        key = self.results.get_key(request, context.invocation_metadata())
+        if key is None:
+            return self.execute_command(blueprint_id, request, context)
+        ret = self.attach(blueprint_id, key, context)
+        if ret is not None:
+            return ret
+        try:
+            ret = self.execute_command(blueprint_id, request, context)
+            return ret
+        finally:
+            self.results.complete(key, ret)
 
+    def execute_command(self, blueprint_id, request, context):
+        self.admit(blueprint_id, context)
         log_results = []
         payload_result = {}
         handler = CommandExecutorHandler(request)
-        payload_result = handler.execute_command(request, log_results)
+        try:
+            payload_result = handler.execute_command(request, log_results)
+        finally:
+            self.admission.release(blueprint_id)
+        return self.execution_response(blueprint_id, request, payload_result, log_results)
+
+    def executeCommandStream(self, request, context):
+        blueprint_id = self.received(request, "executeCommandStream")
+        self.admit(blueprint_id, context)
+        # The command runs on its own thread, feeding its output lines into the stream the RPC thread drains
+        stream = OutputStream()
+        handler = CommandExecutorHandler(request)
+
+        def cancel():
+            # Also called when the RPC completes normally, the command is then over and there is nothing to stop
+            stream.cancel()
+            handler.cancel()
+
+        context.add_callback(cancel)
+
+        def execute_command():
+            payload_result = {"cds_return_code": 1}
+            try:
+                payload_result = handler.execute_command(request, stream) or payload_result
+            finally:
+                self.admission.release(blueprint_id)
+                stream.close(payload_result)
+
+        worker = threading.Thread(target=execute_command, name="{}-stream".format(threading.current_thread().name))
+        worker.start()
+
+        for lines in stream.batches():
+            yield CommandExecutor_pb2.ExecutionStreamOutput(requestId=request.requestId, response=lines)
+        worker.join()
+
+        ret = self.execution_response(blueprint_id, request, stream.result)
+        yield CommandExecutor_pb2.ExecutionStreamOutput(requestId=request.requestId, result=ret)
+
+    def attach(self, blueprint_id, key, context):
+        # The response of an earlier execution of this very request, None once this request owns the execution
+        while True:
+            execution = self.claim(blueprint_id, key)
+            if execution is None:
+                return None
+            try:
+                ret = execution.result(utils.get_time_remaining(context))
+            except futures.TimeoutError:
+                context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, "First execution of the request still running")
+            if ret is not None:
+                return ret
+
+    def admit(self, blueprint_id, context):
+        # Waits for a slot of the blueprint; aborts the RPC with RESOURCE_EXHAUSTED when none comes in time
+        start = time.monotonic()
+        try:
+            self.admission.acquire(blueprint_id)
+        except AdmissionRejected as err:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self.rejected(blueprint_id, err))
+        COMMAND_QUEUE_WAIT_SECONDS.observe(time.monotonic() - start)
+
+    # Shared with AsyncCommandExecutorServer, which only differs in how it waits
+
+    def received(self, request, rpc):
+        blueprint_id = utils.get_blueprint_id(request)
+        self.logger.info("{} - Received {} request".format(blueprint_id, rpc))
+        if os.environ.get('CE_DEBUG','false') == "true":
+            self.logger.info(request)
+        return blueprint_id
+
+    def prepare_env_response(self, blueprint_id, request, success, results, timed_out):
+        if not success:
+            self.logger.info("{} - Failed to prepare python environment. {}".format(blueprint_id, results))
+            return utils.build_response(request, results, {'cds_timed_out': timed_out}, False)
+        self.logger.info("{} - Package installation logs {}".format(blueprint_id, results))
+        return utils.build_response(request, results, {}, True)
+
+    def execution_response(self, blueprint_id, request, payload_result, log_results=None):
+        # Streamed executions already sent their log lines, only the payload is left
         if payload_result["cds_return_code"] != 0:
-            self.logger.info("{} - Failed to executeCommand. {}".format(blueprint_id, log_results))
+            self.logger.info("{} - Failed to executeCommand. {}".format(blueprint_id, log_results or ''))
         else:
             self.logger.info("{} - Execution finished successfully.".format(blueprint_id))
 
-        ret = utils.build_response(request, log_results, payload_result, payload_result["cds_return_code"] == 0)
+        ret = utils.build_response(request, log_results or [], payload_result, payload_result["cds_return_code"] == 0)
         self.logger.info("Payload returned %s" % payload_result)
+        return ret
+
+    def claim(self, blueprint_id, key):
+        # The earlier execution of the request to wait for, None when this request has to run it
+        execution = self.results.claim(key)
+        if execution is None:
+            CACHE_REQUESTS.labels("result", "miss").inc()
+            return None
+        CACHE_REQUESTS.labels("result", "hit" if execution.done() else "attached").inc()
+        self.logger.info("{} - Retry with {}, waiting for the result of its first execution".format(
+            blueprint_id, key[0]))
+        return execution
 
-        return ret
\ No newline at end of file
+    def rejected(self, blueprint_id, err):
+        ADMISSION_REJECTED.inc()
+        self.logger.info("{} - Rejected executeCommand request. {}".format(blueprint_id, err))
+        return str(err)
@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from contextlib import contextmanager
+
+import glob
+import logging
+import os
+import shutil
+import threading
+
+ENV_EVICTION_INTERVAL = float(os.environ.get('CE_ENV_EVICTION_INTERVAL', '300'))
+# Budgets, 0 disables the corresponding check
+ENV_MAX_COUNT = int(os.environ.get('CE_ENV_MAX_COUNT', '0'))
+ENV_MIN_FREE_MB = int(os.environ.get('CE_ENV_MIN_FREE_MB', '0'))
+LAST_USED = '.last_used'
+
+
+class EnvironmentManager:
+    """Keeps track of blueprint environment usage and evicts the least recently used ones over budget.
+
+    Only what prepareEnv created is evicted: the venv links and the .installed marker of the blueprint, then the
+    shared environments no installed blueprint links to anymore. The CBA content itself is never touched.
+    """
+
+    def __init__(self, deploy_home, shared_env_home, venv_links, max_count=ENV_MAX_COUNT,
+                 min_free_mb=ENV_MIN_FREE_MB, interval=ENV_EVICTION_INTERVAL):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.deploy_home = deploy_home
+        self.shared_env_home = shared_env_home
+        self.venv_links = venv_links
+        self.max_count = max_count
+        self.min_free = min_free_mb * 1024 * 1024
+        self.interval = interval
+        self.eviction_listeners = []
+        self._lock = threading.Lock()
+        self._in_use = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def using(self, *paths):
+        # Paths in use are never evicted; acquiring waits for an eviction of the same path already underway
+        with self._lock:
+            for path in paths:
+                self._in_use[path] = self._in_use.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for path in paths:
+                    self._in_use[path] -= 1
+                    if not self._in_use[path]:
+                        del self._in_use[path]
+
+    def touch(self, venv_home):
+        try:
+            with open(os.path.join(venv_home, LAST_USED), "a"):
+                pass
+            os.utime(os.path.join(venv_home, LAST_USED))
+        except OSError:
+            pass
+
+    def start(self):
+        if self.is_enabled() and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="EnvironmentManager", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def is_enabled(self):
+        return self.max_count > 0 or self.min_free > 0
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.evict()
+            except Exception as err:
+                self.logger.info("Failed to evict environments. Error: {}".format(err))
+
+    def evict(self):
+        installed = self.list_installed()
+        for venv_home in installed:
+            if not self.is_over_budget(len(installed)):
+                break
+            if self.evict_blueprint(venv_home):
+                installed = [home for home in installed if home != venv_home]
+                self.collect_shared_envs()
+        self.collect_shared_envs()
+
+    def list_installed(self):
+        # Least recently used first
+        installed = [os.path.dirname(marker) for marker in glob.glob(os.path.join(self.deploy_home, '*', '*',
+                                                                                  '.installed'))]
+        return sorted(installed, key=self.get_last_used)
+
+    def get_last_used(self, venv_home):
+        for name in (LAST_USED, '.installed'):
+            try:
+                return os.path.getmtime(os.path.join(venv_home, name))
+            except OSError:
+                continue
+        return 0
+
+    def is_over_budget(self, count):
+        if self.max_count and count > self.max_count:
+            return True
+        return bool(self.min_free) and shutil.disk_usage(self.deploy_home).free < self.min_free
+
+    def evict_blueprint(self, venv_home):
+        with self._lock:
+            if venv_home in self._in_use:
+                return False
+            self.logger.info("Evicting environment of {}".format(venv_home))
+            os.remove(os.path.join(venv_home, '.installed'))
+            for name in self.venv_links:
+                link = os.path.join(venv_home, name)
+                if os.path.islink(link):
+                    os.remove(link)
+        for listener in self.eviction_listeners:
+            listener(venv_home)
+        return True
+
+    def get_referenced_envs(self):
+        # Shared environments linked from a blueprint that is installed, or being prepared
+        referenced = set()
+        for link in glob.glob(os.path.join(self.deploy_home, '*', '*', 'bin')):
+            venv_home = os.path.dirname(link)
+            if not os.path.islink(link) or not (
+                    venv_home in self._in_use or os.path.exists(os.path.join(venv_home, '.installed'))):
+                continue
+            try:
+                referenced.add(os.path.normpath(os.path.dirname(os.readlink(link))))
+            except OSError:
+                continue
+        return referenced
+
+    def collect_shared_envs(self):
+        referenced = self.get_referenced_envs()
+        for env_home in glob.glob(os.path.join(self.shared_env_home, '*')):
+            if os.path.normpath(env_home) in referenced or env_home.endswith('.evicted'):
+                continue
+            with self._lock:
+                # Checked again right before the rename: a prepareEnv may have linked it during an earlier removal
+                if env_home in self._in_use or os.path.normpath(env_home) in self.get_referenced_envs():
+                    continue
+                # Renaming is atomic, the slow removal then happens outside of the lock
+                trash = env_home + '.evicted'
+                os.rename(env_home, trash)
+            self.logger.info("Evicting shared environment {}".format(env_home))
+            shutil.rmtree(trash, ignore_errors=True)
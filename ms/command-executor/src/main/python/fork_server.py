@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Warm per-venv process that has already imported the heavy modules of a blueprint (ansible, ...) and forks a child
+# for each command, so commands share the imported pages copy-on-write instead of importing everything again.
+#
+# The server side runs with the blueprint venv interpreter and must only depend on the standard library.
+#
+from array import array
+
+import hashlib
+import io
+import json
+import logging
+import os
+import runpy
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+FORK_SERVER_ENABLED = os.environ.get('CE_FORK_SERVER', 'false') == "true"
+FORK_SERVER_PRELOAD = os.environ.get('CE_FORK_SERVER_PRELOAD',
+                                     'ansible,ansible.cli.playbook,ansible.executor.playbook_executor')
+FORK_SERVER_START_TIMEOUT = float(os.environ.get('CE_FORK_SERVER_START_TIMEOUT', '60'))
+# Seconds a fork server without any command to run stays up, 0 keeps it up until the environment is evicted
+FORK_SERVER_IDLE_TIMEOUT = float(os.environ.get('CE_FORK_SERVER_IDLE_TIMEOUT', '600'))
+
+# Kept in sync with payload_channel, this module must stay importable by the blueprint venv interpreter alone
+PAYLOAD_FD_ENV = 'CDS_PAYLOAD_FD'
+
+_LENGTH = struct.Struct('!I')
+_FDS_SIZE = socket.CMSG_SPACE(2 * array('i', [0]).itemsize)
+
+
+def serve(socket_path, idle_timeout, preload):
+    for module in preload:
+        try:
+            __import__(module)
+        except Exception:
+            pass
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(64)
+
+    # Single threaded on purpose: forking a multi-threaded process could leave locks held in the children
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+    children = {}
+    idle_since = time.monotonic()
+    while True:
+        timeout = None
+        if idle_timeout > 0 and not children:
+            timeout = max(0, idle_since + idle_timeout - time.monotonic())
+        events = selector.select(timeout)
+        if not events and not children and timeout is not None:
+            # Nothing forked for a while: give the memory back, the executor starts a new server when needed
+            os.remove(socket_path)
+            return
+        for key, _ in events:
+            if key.fileobj is server:
+                conn, _ = server.accept()
+                try:
+                    request, fds = _receive_request(conn)
+                except Exception:
+                    conn.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    selector.close()
+                    server.close()
+                    for child_conn in children.values():
+                        child_conn.close()
+                    _run_child(conn, request, fds)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                _send_line(conn, pid)
+            else:
+                os.read(wakeup_r, 4096)
+        _reap(children)
+        idle_since = time.monotonic()
+
+
+def _receive_request(conn):
+    fds = array('i')
+    header, ancdata, _, _ = conn.recvmsg(_LENGTH.size, _FDS_SIZE)
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    length = _LENGTH.unpack(header)[0]
+    body = b''
+    while len(body) < length:
+        chunk = conn.recv(length - len(body))
+        if not chunk:
+            raise EOFError("Truncated fork request")
+        body += chunk
+    return json.loads(body.decode()), list(fds)
+
+
+def _reap(children):
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is None:
+            continue
+        returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        try:
+            _send_line(conn, returncode)
+        except OSError:
+            pass
+        conn.close()
+
+
+def _send_line(conn, value):
+    conn.sendall(("%s\n" % value).encode())
+
+
+def _run_child(conn, request, fds):
+    conn.close()
+    code = 1
+    fd = fds[0]
+    try:
+        os.setsid()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        os.close(devnull)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        if request.get('payload_fd_env') and len(fds) > 1:
+            # The payload pipe keeps whatever descriptor number it got in this process
+            os.environ[request['payload_fd_env']] = str(fds[1])
+        sys.argv = request['argv']
+        sys.path.insert(0, os.path.dirname(os.path.abspath(request['script'])))
+        code = 0
+        runpy.run_path(request['script'], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class ForkedProcess:
+    """Popen look-alike for a command forked by the fork server; pid is the leader of its own process group."""
+
+    def __init__(self, conn, stdout_fd):
+        self.conn = conn
+        self.stdout = io.open(stdout_fd, 'rb', buffering=0)
+        self.returncode = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+        self.pid = int(self._read_line(None))
+
+    def poll(self):
+        with self._lock:
+            if self.returncode is None:
+                try:
+                    self._read_returncode(0)
+                except (socket.timeout, BlockingIOError):
+                    pass
+            return self.returncode
+
+    def wait(self, timeout=None):
+        with self._lock:
+            if self.returncode is None:
+                try:
+                    self._read_returncode(timeout)
+                except (socket.timeout, BlockingIOError):
+                    raise subprocess.TimeoutExpired(self.pid, timeout)
+            return self.returncode
+
+    def _read_returncode(self, timeout):
+        line = self._read_line(timeout)
+        # A fork server that died takes the child status with it
+        self.returncode = int(line) if line else -signal.SIGKILL
+
+    def _read_line(self, timeout):
+        self.conn.settimeout(timeout)
+        while b'\n' not in self._buffer:
+            chunk = self.conn.recv(64)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.decode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.stdout.close()
+        try:
+            self.wait()
+        finally:
+            self.conn.close()
+
+
+class ForkServerClient:
+    """Starts and talks to the fork server of one virtual environment."""
+
+    def __init__(self, env_home, env, fingerprint=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.env_home = env_home
+        # Identifies what the server was started from, to tell when it has to be restarted
+        self.fingerprint = fingerprint
+        # Unix socket paths are limited to ~100 characters, blueprint directories can be longer than that
+        self.socket_path = os.path.join(tempfile.gettempdir(),
+                                        'ce-fork-%s.sock' % hashlib.sha1(env_home.encode()).hexdigest()[:16])
+        self.started = time.time()
+        preload = [module for module in FORK_SERVER_PRELOAD.split(',') if module]
+        self.process = subprocess.Popen([os.path.join(env_home, "bin", "python"), os.path.abspath(__file__),
+                                         self.socket_path, str(FORK_SERVER_IDLE_TIMEOUT)] + preload,
+                                        cwd=env_home, env=env, start_new_session=True,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + FORK_SERVER_START_TIMEOUT
+        while not self.is_ready():
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError("Fork server for {} failed to start".format(env_home))
+            time.sleep(0.05)
+        self.logger.info("Fork server started for {} with pid {}".format(env_home, self.process.pid))
+
+    def is_ready(self):
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        if self.is_alive():
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def spawn(self, script, argv, cwd, env, payload_fd=None):
+        fds = [payload_fd] if payload_fd is not None else []
+        body = json.dumps({'script': script, 'argv': argv, 'cwd': cwd, 'env': dict(env),
+                           'payload_fd_env': PAYLOAD_FD_ENV if fds else None}).encode()
+        read_fd, write_fd = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+            conn.sendmsg([_LENGTH.pack(len(body))],
+                          [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', [write_fd] + fds))])
+            conn.sendall(body)
+        except Exception:
+            conn.close()
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return ForkedProcess(conn, read_fd)
+
+
+if __name__ == '__main__':
+    # The executor sources must not leak into the import path of the blueprint commands
+    sys.path.pop(0)
+    serve(sys.argv[1], float(sys.argv[2]), sys.argv[3:])
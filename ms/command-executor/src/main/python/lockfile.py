@@ -0,0 +1,81 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import logging
+import os
+import re
+
+from utils import BLUEPRINTS_DEPLOY_HOME
+
+# Point it at a volume shared by the replicas so they all replay the same locks, empty disables locking
+LOCK_HOME = os.environ.get('CE_LOCK_HOME', BLUEPRINTS_DEPLOY_HOME + '.locks/')
+LOCK_HEADER = "# Pinned by the command executor after installing the environment, delete this file to unlock it"
+PINNED = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)==([^\s;]+)$')
+
+
+class Lockfiles:
+    """Fully pinned requirements of each shared environment, captured once it is installed.
+
+    An environment built again from its lock skips pip's resolver (--no-deps) and gets the exact same versions. Pins
+    carry the sha256 of the wheelhouse wheels they were installed from, so a replay checks it got the same files.
+    """
+
+    def __init__(self, home=LOCK_HOME):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.home = home
+
+    def is_enabled(self):
+        return bool(self.home)
+
+    def get_path(self, env_hash):
+        return os.path.join(self.home, env_hash + '.txt')
+
+    def is_locked(self, env_hash):
+        # A lock without any requirement left, truncated or emptied by hand, would replay into an empty environment
+        try:
+            with open(self.get_path(env_hash)) as f:
+                return any(line.strip() and not line.startswith('#') for line in f)
+        except OSError:
+            return False
+
+    def save(self, env_hash, freeze, wheelhouse):
+        lines = [line.strip() for line in freeze.splitlines() if line.strip() and not line.startswith('#')]
+        # pip only checks hashes when every requirement has one, so it is all or nothing
+        hashes = [self.get_hashes(line, wheelhouse) for line in lines]
+        if all(hashes):
+            lines = ["%s %s" % (line, ' '.join('--hash=sha256:%s' % digest for digest in digests))
+                     for line, digests in zip(lines, hashes)]
+
+        os.makedirs(self.home, exist_ok=True)
+        path = self.get_path(env_hash)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join([LOCK_HEADER] + lines) + '\n')
+        os.replace(tmp_path, path)
+        self.logger.info("Locked {} packages in {}".format(len(lines), path))
+
+    def get_hashes(self, line, wheelhouse):
+        match = PINNED.match(line)
+        if match is None or not wheelhouse.is_enabled():
+            return []
+        name = re.sub(r'[-_.]+', '_', match.group(1)).lower()
+        digests = []
+        for wheel in sorted(wheelhouse.list_wheels()):
+            parts = wheel.split('-')
+            if len(parts) >= 2 and parts[0].lower() == name and parts[1] == match.group(2):
+                with open(os.path.join(wheelhouse.home, wheel), 'rb') as f:
+                    digests.append(hashlib.sha256(f.read()).hexdigest())
+        return digests
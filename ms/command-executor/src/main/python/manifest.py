@@ -0,0 +1,73 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+import os
+
+MANIFEST = '.manifest.json'
+
+
+class Manifest:
+    """What prepareEnv installed in an environment, one entry at a time.
+
+    Every change is saved right away, so a prepareEnv that failed or was interrupted half way leaves behind the exact
+    list of what is already in, and the next one only installs what is missing.
+    """
+
+    def __init__(self, home):
+        self.path = os.path.join(home, MANIFEST)
+        self.content = self.load()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return content if isinstance(content, dict) else {}
+
+    def save(self):
+        # Replaced rather than rewritten: a crash never leaves a truncated manifest, and environments cloned with
+        # hardlinks never see each other's changes
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.content, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        return self.content.get(key, default)
+
+    def set(self, key, value):
+        self.content[key] = value
+        self.save()
+
+    def get_missing(self, key, entries):
+        installed = set(self.content.get(key, []))
+        return [entry for entry in entries if entry not in installed]
+
+    def add(self, key, entries):
+        installed = self.content.setdefault(key, [])
+        for entry in entries:
+            if entry not in installed:
+                installed.append(entry)
+        self.save()
+
+    def discard(self, key, entries):
+        installed = self.content.get(key, [])
+        self.content[key] = [entry for entry in installed if entry not in entries]
+        self.save()
@@ -0,0 +1,233 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Minimal Prometheus instrumentation, serving the text exposition format on a side port with the standard library
+# only.
+#
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import logging
+import os
+import threading
+import time
+
+# Port of the /metrics endpoint, 0 disables it
+METRICS_PORT = int(os.environ.get('CE_METRICS_PORT', '0'))
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def collect(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.type)]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.collect(self.name, self.labelnames, values))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+class _Value:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def collect(self, name, labelnames, values):
+        return ["%s%s %s" % (name, _format_labels(labelnames, values), _format_value(self.value))]
+
+
+class _HistogramValue:
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start)
+
+    def collect(self, name, labelnames, values):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append("%s_bucket%s %d" % (name, _format_labels(labelnames, values, [('le', _format_value(bound))]),
+                                             cumulative))
+        lines.append("%s_sum%s %s" % (name, _format_labels(labelnames, values), _format_value(total)))
+        lines.append("%s_count%s %d" % (name, _format_labels(labelnames, values), count))
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets) + (float('inf'),)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+PREPARE_ENV_SECONDS = Histogram('command_executor_prepare_env_seconds',
+                                'Time to prepare a blueprint environment', ['result'])
+PREPARE_ENV_PHASE_SECONDS = Histogram('command_executor_prepare_env_phase_seconds',
+                                      'Time spent in each phase of prepareEnv: venv creation, pip and galaxy installs',
+                                      ['phase'])
+COMMAND_QUEUE_WAIT_SECONDS = Histogram('command_executor_command_queue_wait_seconds',
+                                       'Time executeCommand requests waited for admission')
+COMMAND_RUN_SECONDS = Histogram('command_executor_command_run_seconds',
+                                'Time executeCommand commands ran', ['status'])
+COMMAND_OUTPUT_BYTES = Histogram('command_executor_command_output_bytes',
+                                 'Output produced by executeCommand commands', buckets=SIZE_BUCKETS)
+COMMANDS_IN_FLIGHT = Gauge('command_executor_commands_in_flight',
+                           'Commands running, per blueprint', ['blueprint'])
+CACHE_REQUESTS = Counter('command_executor_cache_requests_total',
+                         'Lookups of the environment caches, by cache and hit or miss', ['cache', 'result'])
+TIMEOUTS = Counter('command_executor_timeouts_total',
+                   'Commands and package installs stopped for running past the request timeOut', ['operation'])
+ADMISSION_REJECTED = Counter('command_executor_admission_rejected_total',
+                             'executeCommand requests rejected with RESOURCE_EXHAUSTED')
+
+
+def generate_latest():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = generate_latest().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_http_server(port=METRICS_PORT):
+    server = _MetricsServer(('', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="Metrics", daemon=True).start()
+    logging.getLogger("Metrics").info("Metrics endpoint started on %s" % port)
+    return server
@@ -0,0 +1,185 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import deque
+
+import asyncio
+import codecs
+import glob
+import os
+import re
+import selectors
+import tempfile
+import time
+
+OUTPUT_MAX_BYTES = int(os.environ.get('CE_OUTPUT_MAX_BYTES', str(1024 * 1024)))
+OUTPUT_SPILL_HOME = os.environ.get('CE_OUTPUT_SPILL_HOME', '/opt/app/onap/logs/command-output/')
+OUTPUT_SPILL_RETENTION_HOURS = float(os.environ.get('CE_OUTPUT_SPILL_RETENTION_HOURS', '24'))
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds the output of a command that exited is still read, for what it wrote last; processes it left running in the
+# background keep the pipes open and are not waited for
+DRAIN_TIMEOUT = float(os.environ.get('CE_DRAIN_TIMEOUT', '1'))
+POLL_INTERVAL = 0.1
+
+
+class LineDecoder:
+    """Splits chunks of process output into decoded lines, whatever the chunk boundaries."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._pending = ''
+
+    def decode(self, chunk, final=False):
+        self._pending += self._decoder.decode(chunk, final)
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+        if final and self._pending:
+            lines.append(self._pending)
+            self._pending = ''
+        return lines
+
+
+def read_lines(stream, on_line, process=None):
+    """Reads a process output stream in large chunks until EOF and calls on_line for every decoded line.
+
+    When the process is given, reading stops at most DRAIN_TIMEOUT seconds after it exited.
+    """
+    fd = stream.fileno()
+    decoder = LineDecoder()
+    drain_until = None
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        while True:
+            if drain_until is None and process is not None and process.poll() is not None:
+                drain_until = time.monotonic() + DRAIN_TIMEOUT
+            if drain_until is not None and time.monotonic() >= drain_until:
+                break
+            if not selector.select(timeout=1.0 if process is None else POLL_INTERVAL):
+                continue
+            chunk = os.read(fd, READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            for line in decoder.decode(chunk):
+                on_line(line)
+    for line in decoder.decode(b'', final=True):
+        on_line(line)
+
+
+async def read_lines_async(reader, on_line, drain=None, process=None):
+    """Same as read_lines for an asyncio stream reader; drain, when given, is awaited after every chunk."""
+    decoder = LineDecoder()
+    drain_until = None
+    while True:
+        if drain_until is None and process is not None and process.returncode is not None:
+            drain_until = time.monotonic() + DRAIN_TIMEOUT
+        if drain_until is not None and time.monotonic() >= drain_until:
+            break
+        try:
+            chunk = await asyncio.wait_for(reader.read(READ_CHUNK_SIZE), None if process is None else POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            continue
+        if not chunk:
+            break
+        for line in decoder.decode(chunk):
+            on_line(line)
+        if drain is not None:
+            await drain()
+    for line in decoder.decode(b'', final=True):
+        on_line(line)
+
+
+class OutputCapture:
+    """Keeps the head and the tail of a command output in memory, within max_bytes.
+
+    Once the output grows past max_bytes, all of it is spilled to a per-request file and only its head and tail
+    make it into the results, with a line pointing at the file in between.
+    """
+
+    def __init__(self, results, name, max_bytes=OUTPUT_MAX_BYTES, spill_home=OUTPUT_SPILL_HOME):
+        self.results = results
+        self.name = name
+        self.head_bytes = max_bytes // 2
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.spill_home = spill_home
+        self.spill_path = None
+        self.omitted_bytes = 0
+        self._size = 0
+        self._head_start = len(results)
+        self._head_count = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._spill = None
+        self._spill_tried = not spill_home
+
+    def append(self, line):
+        line = str(line)
+        size = len(line) + 1
+        self._size += size
+        if self._size <= self.head_bytes and not self._tail:
+            self.results.append(line)
+            self._head_count += 1
+            return
+
+        if self._spill is not None:
+            self._spill.write(line + '\n')
+        self._tail.append(line)
+        self._tail_size += size
+        while self._tail_size > self.tail_bytes and self._tail:
+            if not self._spill_tried:
+                self._open_spill()
+            dropped = self._tail.popleft()
+            self._tail_size -= len(dropped) + 1
+            self.omitted_bytes += len(dropped) + 1
+
+    def close(self):
+        if self.omitted_bytes:
+            if self.spill_path:
+                self.results.append("... %d bytes of output omitted, full output in %s ..." % (self.omitted_bytes,
+                                                                                               self.spill_path))
+            else:
+                self.results.append("... %d bytes of output omitted ..." % self.omitted_bytes)
+        self.results.extend(self._tail)
+        self._tail.clear()
+        if self._spill is not None:
+            self._spill.close()
+
+    def _open_spill(self):
+        self._spill_tried = True
+        try:
+            os.makedirs(self.spill_home, exist_ok=True)
+            self._remove_expired_spills()
+            # The name comes from the request, it must not reach outside the spill directory nor clash with another
+            name = re.sub(r'[^A-Za-z0-9._-]+', '_', self.name).lstrip('.')[:64] or "command"
+            fd, self.spill_path = tempfile.mkstemp(prefix="%s-%d-" % (name, time.time() * 1000), suffix=".log",
+                                                   dir=self.spill_home)
+            self._spill = open(fd, "w")
+        except OSError:
+            self.spill_path = None
+            self._spill = None
+            return
+        # Nothing was dropped yet, the spill file starts with the head and tail captured so far
+        for line in self.results[self._head_start:self._head_start + self._head_count]:
+            self._spill.write(line + '\n')
+        for line in self._tail:
+            self._spill.write(line + '\n')
+
+    def _remove_expired_spills(self):
+        expiry = time.time() - OUTPUT_SPILL_RETENTION_HOURS * 3600
+        for path in glob.glob(os.path.join(self.spill_home, '*.log')):
+            try:
+                if os.path.getmtime(path) < expiry:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,149 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import os
+import queue
+import threading
+
+STREAM_BATCH_LINES = int(os.environ.get('CE_STREAM_BATCH_LINES', '100'))
+STREAM_BATCH_INTERVAL = float(os.environ.get('CE_STREAM_BATCH_INTERVAL', '0.5'))
+# Batches waiting for a slow client; once reached the command output reader blocks until the client catches up
+STREAM_MAX_PENDING_BATCHES = int(os.environ.get('CE_STREAM_MAX_PENDING_BATCHES', '16'))
+
+_END = object()
+
+
+class OutputStream:
+    """List-like sink for command output that hands the lines over to a consumer in bounded batches.
+
+    The handler appends lines from its own thread as if this was the usual results list, while the gRPC thread
+    iterates over batches() to stream them out.
+    """
+
+    def __init__(self, batch_lines=STREAM_BATCH_LINES, batch_interval=STREAM_BATCH_INTERVAL,
+                 max_pending_batches=STREAM_MAX_PENDING_BATCHES):
+        self.batch_lines = batch_lines
+        self.batch_interval = batch_interval
+        self.result = None
+        self.cancelled = False
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._lock = threading.Lock()
+        self._batch = []
+        self._putting = False
+
+    def append(self, line):
+        with self._lock:
+            self._batch.append(str(line))
+            if len(self._batch) < self.batch_lines:
+                return
+            batch = self._take_batch()
+        self._put(batch)
+
+    def close(self, result):
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._put(batch)
+        self.result = result
+        self._put(_END)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def batches(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.batch_interval)
+            except queue.Empty:
+                # Quiet command: flush what is buffered so the client still sees progress, unless an earlier
+                # batch is on its way into the queue and has to go out first
+                with self._lock:
+                    if self._putting:
+                        continue
+                    batch = self._batch
+                    self._batch = []
+                if batch:
+                    yield batch
+                continue
+            if batch is _END:
+                return
+            yield batch
+
+    def _take_batch(self):
+        # Called with the lock held by the producer; the batch is flagged as in flight until _put queued it
+        batch = self._batch
+        self._batch = []
+        self._putting = True
+        return batch
+
+    def _put(self, item):
+        try:
+            while not self.cancelled:
+                try:
+                    self._queue.put(item, timeout=self.batch_interval)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            with self._lock:
+                self._putting = False
+
+
+class AsyncOutputStream:
+    """OutputStream for a command driven by the event loop, where producer and consumer share a single thread.
+
+    The command output reader awaits drain() after each chunk, which is where it waits for a slow client.
+    """
+
+    def __init__(self, batch_lines=STREAM_BATCH_LINES, batch_interval=STREAM_BATCH_INTERVAL,
+                 max_pending_batches=STREAM_MAX_PENDING_BATCHES):
+        self.batch_lines = batch_lines
+        self.batch_interval = batch_interval
+        self.result = None
+        self._queue = asyncio.Queue(maxsize=max_pending_batches)
+        self._batch = []
+
+    def append(self, line):
+        self._batch.append(str(line))
+
+    async def drain(self):
+        if len(self._batch) >= self.batch_lines:
+            batch = self._batch
+            self._batch = []
+            await self._queue.put(batch)
+
+    async def close(self, result):
+        if self._batch:
+            batch = self._batch
+            self._batch = []
+            await self._queue.put(batch)
+        self.result = result
+        await self._queue.put(_END)
+
+    async def batches(self):
+        while True:
+            try:
+                batch = await asyncio.wait_for(self._queue.get(), self.batch_interval)
+            except asyncio.TimeoutError:
+                # Nothing queued means no batch is waiting to get in either, the buffered lines can go out now
+                batch = self._batch
+                self._batch = []
+                if batch:
+                    yield batch
+                continue
+            if batch is _END:
+                return
+            yield batch
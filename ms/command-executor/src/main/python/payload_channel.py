@@ -0,0 +1,124 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import json
+import os
+import selectors
+import struct
+import threading
+import time
+
+from output_capture import DRAIN_TIMEOUT, POLL_INTERVAL
+
+# Must match cds_utils.payload_coder, which runs inside the blueprint environment
+PAYLOAD_FD_ENV = 'CDS_PAYLOAD_FD'
+
+_LENGTH = struct.Struct('!I')
+
+
+class PayloadChannel:
+    """Pipe inherited by the command, carrying length-prefixed JSON payloads next to its stdout.
+
+    The read end is drained on a thread while the command runs, so a payload larger than the pipe buffer never
+    blocks the command. The last payload sent wins, as with the stdout markers. Processes the command left running in
+    the background inherit the pipe too, it is only drained for DRAIN_TIMEOUT seconds once the command exited.
+    """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self._data = bytearray()
+        self._thread = threading.Thread(target=self._drain, name="{}-payload".format(threading.current_thread().name),
+                                        daemon=True)
+        self._loop = None
+        self._eof = None
+        self._drain_until = None
+
+    def start(self, loop=None):
+        # Only the command keeps a write end open, so EOF is seen when the command and its children are done
+        os.close(self.write_fd)
+        self.write_fd = None
+        if loop is None:
+            self._thread.start()
+            return
+        # Drained by the event loop instead of a thread
+        self._loop = loop
+        self._eof = loop.create_future()
+        os.set_blocking(self.read_fd, False)
+        loop.add_reader(self.read_fd, self._read_ready)
+
+    def close(self):
+        # Called once the command exited
+        if self._thread.ident is not None:
+            self._drain_until = time.monotonic() + DRAIN_TIMEOUT
+            self._thread.join()
+        elif self._eof is not None:
+            if not self._eof.done():
+                self._close_reader()
+        elif self.write_fd is not None:
+            # The command never started, there is nothing to drain
+            os.close(self.write_fd)
+            os.close(self.read_fd)
+            self.write_fd = None
+
+    async def get_payload_async(self):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._eof), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        return self.get_payload()
+
+    def get_payload(self):
+        # None when the command did not send any payload through the channel
+        self.close()
+        payload = None
+        offset = 0
+        while offset + _LENGTH.size <= len(self._data):
+            length = _LENGTH.unpack_from(self._data, offset)[0]
+            offset += _LENGTH.size
+            if offset + length > len(self._data):
+                break
+            payload = json.loads(self._data[offset:offset + length].decode())
+            offset += length
+        return payload
+
+    def _drain(self):
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.read_fd, selectors.EVENT_READ)
+                while self._drain_until is None or time.monotonic() < self._drain_until:
+                    if not selector.select(timeout=POLL_INTERVAL):
+                        continue
+                    chunk = os.read(self.read_fd, 64 * 1024)
+                    if not chunk:
+                        break
+                    self._data += chunk
+        finally:
+            os.close(self.read_fd)
+
+    def _read_ready(self):
+        try:
+            chunk = os.read(self.read_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        if chunk:
+            self._data += chunk
+        else:
+            self._close_reader()
+
+    def _close_reader(self):
+        self._loop.remove_reader(self.read_fd)
+        os.close(self.read_fd)
+        self._eof.set_result(None)
@@ -24,6 +24,11 @@ class CommandExecutorServiceStub(object):
         request_serializer=CommandExecutor__pb2.ExecutionInput.SerializeToString,
         response_deserializer=CommandExecutor__pb2.ExecutionOutput.FromString,
         )
+    self.executeCommandStream = channel.unary_stream(
+        '/org.onap.ccsdk.cds.controllerblueprints.command.api.CommandExecutorService/executeCommandStream',
+        request_serializer=CommandExecutor__pb2.ExecutionInput.SerializeToString,
+        response_deserializer=CommandExecutor__pb2.ExecutionStreamOutput.FromString,
+        )
 
 
 class CommandExecutorServiceServicer(object):
@@ -44,6 +49,13 @@ class CommandExecutorServiceServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def executeCommandStream(self, request, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
 
 def add_CommandExecutorServiceServicer_to_server(servicer, server):
   rpc_method_handlers = {
@@ -57,6 +69,11 @@ def add_CommandExecutorServiceServicer_to_server(servicer, server):
           request_deserializer=CommandExecutor__pb2.ExecutionInput.FromString,
           response_serializer=CommandExecutor__pb2.ExecutionOutput.SerializeToString,
       ),
+      'executeCommandStream': grpc.unary_stream_rpc_method_handler(
+          servicer.executeCommandStream,
+          request_deserializer=CommandExecutor__pb2.ExecutionInput.FromString,
+          response_serializer=CommandExecutor__pb2.ExecutionStreamOutput.SerializeToString,
+      ),
   }
   generic_handler = grpc.method_handlers_generic_handler(
       'org.onap.ccsdk.cds.controllerblueprints.command.api.CommandExecutorService', rpc_method_handlers)
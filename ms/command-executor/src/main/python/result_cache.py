@@ -0,0 +1,128 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import OrderedDict
+from concurrent import futures
+from google.protobuf.json_format import MessageToDict
+
+import hashlib
+import json
+import os
+import threading
+import time
+import utils
+import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+
+# Seconds an executeCommand result is kept for retries of the same request, 0 disables the cache
+RESULT_CACHE_TTL = float(os.environ.get('CE_RESULT_CACHE_TTL', '0'))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('CE_RESULT_CACHE_MAX_ENTRIES', '1000'))
+# Total size of the responses kept, a larger response is never kept
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('CE_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# gRPC metadata a client sends with the same value on every retry of a request
+IDEMPOTENCY_KEY = 'x-idempotency-key'
+# Whether requests without idempotency key are cached by request and correlation id. Only for clients that never run
+# the same command again with the same ids on purpose, as their retries would get the cached result instead
+RESULT_CACHE_REQUEST_KEY = os.environ.get('CE_RESULT_CACHE_REQUEST_KEY', 'false') == "true"
+
+
+class _Entry:
+
+    def __init__(self):
+        self.execution = futures.Future()
+        # Set once the execution is over
+        self.expires = None
+        self.size = 0
+
+
+class ResultCache:
+    """ExecutionOutput of the executeCommand requests recently run, by idempotency key or request id.
+
+    A retry of a request, same idempotency key, blueprint, command and properties, attaches to the execution still
+    running or gets its result while it is cached instead of running the command again. With request_key, the request
+    and correlation ids stand for the idempotency key of requests sent without one. Only successful responses are
+    kept. They are dropped after the TTL or when over the maximum number of entries or bytes, least recently used
+    first; executions still running are never dropped.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 request_key=RESULT_CACHE_REQUEST_KEY):
+        self.ttl = ttl
+        self.request_key = request_key
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def is_enabled(self):
+        return self.ttl > 0
+
+    def get_key(self, request, metadata):
+        # None when the client did not tell its retries apart from new requests; unless request_key is set, request
+        # ids are not used as they are reused by clients running the same command again on purpose
+        if not self.is_enabled():
+            return None
+        idempotency_key = next((value for key, value in metadata if key == IDEMPOTENCY_KEY), None)
+        if idempotency_key:
+            idempotency_key = "{} {}".format(IDEMPOTENCY_KEY, idempotency_key)
+        elif self.request_key and request.requestId:
+            idempotency_key = "requestId {} correlationId {}".format(request.requestId, request.correlationId)
+        else:
+            return None
+        properties = json.dumps(MessageToDict(request.properties), sort_keys=True)
+        digest = hashlib.sha256((request.command + '\0' + properties).encode()).hexdigest()
+        return idempotency_key, utils.get_blueprint_id(request), digest
+
+    def claim(self, key):
+        # The execution to wait for; None when there is none and the caller has to run it, then call complete()
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry.execution
+            self._entries[key] = _Entry()
+            self._trim()
+            return None
+
+    def complete(self, key, response):
+        # The requests attached meanwhile get the response whatever it is, a failure included; a None response, the
+        # execution failed before producing any, makes them run again
+        with self._lock:
+            entry = self._entries[key]
+            size = response.ByteSize() if response is not None else 0
+            if response is None or response.status != CommandExecutor_pb2.SUCCESS or size > self.max_bytes:
+                self._drop(key)
+            else:
+                entry.expires = time.monotonic() + self.ttl
+                entry.size = size
+                self.size += size
+                self._trim()
+        entry.execution.set_result(response)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires is not None and entry.expires < now]:
+            self._drop(key)
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            key = next((key for key, entry in self._entries.items() if entry.expires is not None), None)
+            if key is None:
+                return
+            self._drop(key)
+
+    def _drop(self, key):
+        self.size -= self._entries.pop(key).size
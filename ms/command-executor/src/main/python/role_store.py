@@ -0,0 +1,125 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+from single_flight import SingleFlight
+from utils import BLUEPRINTS_DEPLOY_HOME
+
+# Empty disables the store, roles are then installed into each blueprint as before
+ROLE_STORE_HOME = os.environ.get('CE_ROLE_STORE_HOME', BLUEPRINTS_DEPLOY_HOME + '.roles/')
+INSTALLED = '.installed'
+
+
+class RoleStore:
+    """Ansible Galaxy roles installed once per role@version, then linked into the roles path of each blueprint.
+
+    An entry holds the role and the dependencies galaxy installed along with it. Entries are never refreshed: a role
+    requested without a version stays at the one first installed until its entry is invalidated, by deleting its
+    directory or its .installed marker.
+    """
+
+    def __init__(self, home=ROLE_STORE_HOME):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.home = home
+        self.flights = SingleFlight()
+
+    def is_enabled(self):
+        return bool(self.home)
+
+    def get_path(self, role):
+        # "name,version" is galaxy's role@version; the digest keeps sources differing only in unsafe characters apart
+        role = role.strip()
+        name = re.sub(r'[^A-Za-z0-9._@-]+', '_', role.replace(',', '@'))[:100]
+        return os.path.join(self.home, '%s-%s' % (name, hashlib.sha256(role.encode()).hexdigest()[:12]))
+
+    def is_stored(self, role):
+        return os.path.exists(os.path.join(self.get_path(role), INSTALLED))
+
+    def fill(self, role, install):
+        # install(path) installs the role into path; concurrent requests for the same role wait for the first one
+        return self.flights.do(self.get_path(role), lambda: self._fill(role, install))
+
+    def _fill(self, role, install):
+        if self.is_stored(role):
+            return True
+        path = self.get_path(role)
+        os.makedirs(self.home, exist_ok=True)
+        # Installed under a hidden name and renamed in place, a half-installed role is never linked
+        tmp_path = tempfile.mkdtemp(prefix='.%s.' % os.path.basename(path), dir=self.home)
+        try:
+            if not install(tmp_path):
+                return False
+            open(os.path.join(tmp_path, INSTALLED), 'w').close()
+            if not self.is_stored(role):
+                # Leftover of an invalidated entry
+                shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Filled meanwhile by another executor sharing the store
+                if not self.is_stored(role):
+                    raise
+            self.logger.info("Stored ansible role {} in {}".format(role, path))
+            return True
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def is_linked(self, role, roles_path):
+        # Whether every role of the entry is reachable from roles_path, false once the entry was invalidated
+        if not self.is_stored(role):
+            return False
+        path = self.get_path(role)
+        for name in os.listdir(path):
+            target = os.path.join(path, name)
+            if name == INSTALLED or not os.path.isdir(target):
+                continue
+            link = os.path.join(roles_path, name)
+            if not os.path.exists(link) or os.path.islink(link) and not self.is_entry_link(link, name):
+                return False
+        return True
+
+    def is_entry_link(self, link, name):
+        # Roles sharing a dependency link it from whichever of their entries was linked first
+        target = os.readlink(link)
+        entry = os.path.dirname(target)
+        return os.path.basename(target) == name and os.path.dirname(entry) == os.path.normpath(self.home) and \
+            os.path.exists(os.path.join(entry, INSTALLED))
+
+    def link(self, role, roles_path):
+        # Roles shipped in the blueprint itself keep precedence, as with a plain galaxy install
+        path = self.get_path(role)
+        os.makedirs(roles_path, exist_ok=True)
+        for name in os.listdir(path):
+            target = os.path.join(path, name)
+            if name == INSTALLED or not os.path.isdir(target):
+                continue
+            link = os.path.join(roles_path, name)
+            if os.path.islink(link):
+                if self.is_entry_link(link, name):
+                    continue
+                os.remove(link)
+            elif os.path.exists(link):
+                continue
+            try:
+                os.symlink(target, link)
+            except FileExistsError:
+                # Linked meanwhile by a concurrent install of another role sharing the dependency
+                pass
@@ -19,6 +19,7 @@
 from builtins import KeyboardInterrupt
 from concurrent import futures
 import logging
+import os
 import time
 import sys
 
@@ -28,10 +29,14 @@ import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
 
 from request_header_validator_interceptor import RequestHeaderValidatorInterceptor
 from command_executor_server import CommandExecutorServer
+from command_executor_handler import ENV_MANAGER
+from metrics import METRICS_PORT, start_http_server
 
 logger = logging.getLogger("Server")
 
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
+# Requests waiting for admission hold a thread too, size it above CE_ADMISSION_MAX_CONCURRENT to queue them fairly
+MAX_WORKERS = int(os.environ.get('CE_MAX_WORKERS', '15'))
 
 
 def serve():
@@ -43,7 +48,7 @@ def serve():
         'Access denied!')
 
     server = grpc.server(
-        futures.ThreadPoolExecutor(max_workers=15),
+        futures.ThreadPoolExecutor(max_workers=MAX_WORKERS),
         interceptors=(header_validator,))
 
     CommandExecutor_pb2_grpc.add_CommandExecutorServiceServicer_to_server(
@@ -51,6 +56,9 @@ def serve():
 
     server.add_insecure_port('[::]:' + port)
     server.start()
+    ENV_MANAGER.start()
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
 
     logger.info("Command Executor Server started on %s" % port)
 
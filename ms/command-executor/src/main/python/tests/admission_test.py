@@ -0,0 +1,120 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def queue(controller, blueprint_ids, order):
+    """Start a request per blueprint id, each one recording its admission and releasing its slot right away."""
+    def run(blueprint_id):
+        controller.acquire(blueprint_id)
+        order.append(blueprint_id)
+        controller.release(blueprint_id)
+
+    threads = []
+    for blueprint_id in blueprint_ids:
+        thread = threading.Thread(target=run, args=(blueprint_id,))
+        thread.start()
+        threads.append(thread)
+        # Queued one at a time, so the order they were queued in is known
+        wait_for(lambda: controller.waiting == len(threads))
+    return threads
+
+
+def test_admits_right_away_under_the_limits():
+    """Test requests are not queued while there are free slots."""
+    controller = AdmissionController(max_concurrent=2)
+    controller.acquire("a/1")
+    controller.acquire("b/1")
+    assert controller.running == 2
+    controller.release("a/1")
+    controller.release("b/1")
+    assert controller.running == 0
+
+
+def test_blueprint_queued_behind_another_goes_first():
+    """Test a blueprint gets a slot before the backlog of a blueprint that already had one."""
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire("a/1")
+    order = []
+    threads = queue(controller, ["a/1", "a/1", "a/1", "b/1"], order)
+    controller.release("a/1")
+    for thread in threads:
+        thread.join(5)
+    assert order == ["b/1", "a/1", "a/1", "a/1"]
+
+
+def test_slots_shared_by_weight():
+    """Test a blueprint weighted 3 gets three times the slots of one weighted 1 while both are queued."""
+    controller = AdmissionController(max_concurrent=1, weights="a=3")
+    controller.acquire("x/1")
+    order = []
+    threads = queue(controller, ["a/1"] * 6 + ["b/1"] * 6, order)
+    controller.release("x/1")
+    for thread in threads:
+        thread.join(5)
+    assert order[:8].count("a/1") == 6
+    assert order[:8].count("b/1") == 2
+
+
+def test_per_blueprint_limit():
+    """Test a blueprint at its limit waits while another one still runs."""
+    controller = AdmissionController(max_per_blueprint=1)
+    controller.acquire("a/1")
+    order = []
+    threads = queue(controller, ["a/1"], order)
+    controller.acquire("b/1")
+    assert order == []
+    controller.release("a/1")
+    threads[0].join(5)
+    assert order == ["a/1"]
+    controller.release("b/1")
+
+
+def test_rejects_when_the_queue_is_full():
+    """Test a request finding the queue full is rejected instead of queued."""
+    controller = AdmissionController(max_concurrent=1, max_queue_depth=1)
+    controller.acquire("a/1")
+    threads = queue(controller, ["a/1"], [])
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b/1")
+    assert controller.waiting == 1
+    controller.release("a/1")
+    threads[0].join(5)
+    assert controller.running == 0
+
+
+def test_rejects_after_the_maximum_wait():
+    """Test a request still queued after the maximum wait is rejected and leaves the queue."""
+    controller = AdmissionController(max_concurrent=1, max_wait=0.1)
+    controller.acquire("a/1")
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b/1")
+    assert controller.waiting == 0
+    controller.release("a/1")
+    controller.acquire("b/1")
+    controller.release("b/1")
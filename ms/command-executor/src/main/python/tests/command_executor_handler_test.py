@@ -0,0 +1,201 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import base64
+import hashlib
+import os
+import shutil
+import sys
+import zipfile
+
+import pytest
+
+import command_executor_handler as handler
+import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+from env_manager import EnvironmentManager
+from lockfile import Lockfiles
+from manifest import Manifest
+from role_store import RoleStore
+from venv_template import VenvTemplate
+from wheelhouse import Wheelhouse
+
+
+@pytest.fixture(scope="module")
+def template_home(tmp_path_factory):
+    # Created once, every environment of the tests is cloned from it
+    return str(tmp_path_factory.mktemp("template") / "venv")
+
+
+@pytest.fixture
+def deploy_home(tmp_path, template_home, monkeypatch):
+    # Everything prepareEnv writes goes below tmp_path, pip never reaches out to an index
+    deploy_home = str(tmp_path / "deploy") + "/"
+    shared_env_home = deploy_home + ".envs/"
+    monkeypatch.setattr(handler, "BLUEPRINTS_DEPLOY_HOME", deploy_home)
+    monkeypatch.setattr(handler, "SHARED_ENV_HOME", shared_env_home)
+    monkeypatch.setattr(handler, "ENV_MANAGER", EnvironmentManager(deploy_home, shared_env_home, handler.VENV_LINKS))
+    monkeypatch.setattr(handler, "VENV_TEMPLATE", VenvTemplate(template_home))
+    monkeypatch.setattr(handler, "WHEELHOUSE", Wheelhouse(""))
+    monkeypatch.setattr(handler, "LOCKFILES", Lockfiles(""))
+    monkeypatch.setattr(handler, "ROLE_STORE", RoleStore(""))
+    monkeypatch.setenv("PIP_NO_INDEX", "1")
+    monkeypatch.setenv("PIP_DISABLE_PIP_VERSION_CHECK", "1")
+    return deploy_home
+
+
+def get_request(name, version="1.0.0", pip=()):
+    # The CBA content is deployed before prepareEnv is called
+    os.makedirs(os.path.join(handler.BLUEPRINTS_DEPLOY_HOME, name, version), exist_ok=True)
+    packages = [CommandExecutor_pb2.Packages(type=CommandExecutor_pb2.pip, package=list(pip))] if pip else []
+    return CommandExecutor_pb2.PrepareEnvInput(
+        requestId="1234", packages=packages,
+        identifiers=CommandExecutor_pb2.Identifiers(blueprintName=name, blueprintVersion=version))
+
+
+def make_wheel(directory, name, version):
+    # Smallest wheel pip installs, so the tests never need an index
+    path = os.path.join(str(directory), "%s-%s-py3-none-any.whl" % (name, version))
+    dist_info = "%s-%s.dist-info" % (name, version)
+    files = {name + "/__init__.py": "VERSION = %r\n" % version,
+             dist_info + "/METADATA": "Metadata-Version: 2.1\nName: %s\nVersion: %s\n" % (name, version),
+             dist_info + "/WHEEL": "Wheel-Version: 1.0\nGenerator: tests\nRoot-Is-Purelib: true\nTag: py3-none-any\n"}
+    record = []
+    for file, content in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(content.encode()).digest()).rstrip(b"=").decode()
+        record.append("%s,sha256=%s,%d" % (file, digest, len(content)))
+    files[dist_info + "/RECORD"] = "\n".join(record + [dist_info + "/RECORD,,"]) + "\n"
+    with zipfile.ZipFile(path, "w") as wheel:
+        for file, content in files.items():
+            wheel.writestr(file, content)
+    return path
+
+
+def get_env_home(request):
+    venv_home = handler.CommandExecutorHandler(request).venv_home
+    return os.path.dirname(os.path.realpath(os.path.join(venv_home, "bin")))
+
+
+def prepare(request):
+    success, results, _ = handler.prepare_env(request)
+    assert success, results
+    return "".join(str(result) for result in results)
+
+
+def test_blueprints_share_environment(deploy_home):
+    """Test blueprints declaring the same packages link the same shared environment, built once."""
+    prepare(get_request("first"))
+    results = prepare(get_request("second"))
+    assert "Reusing shared environment" in results
+    assert get_env_home(get_request("first")) == get_env_home(get_request("second"))
+    assert os.listdir(handler.SHARED_ENV_HOME) == [os.path.basename(get_env_home(get_request("first")))]
+
+
+def test_prepared_blueprint_is_not_prepared_again(deploy_home):
+    """Test a blueprint prepared with the same packages is served from its .installed marker."""
+    prepare(get_request("first"))
+    installed = os.stat(os.path.join(deploy_home, "first", "1.0.0", ".installed")).st_mtime_ns
+    prepare(get_request("first"))
+    assert os.stat(os.path.join(deploy_home, "first", "1.0.0", ".installed")).st_mtime_ns == installed
+
+
+def test_blueprint_content_is_kept(deploy_home):
+    """Test a blueprint shipping its own bin directory is not linked, and its content is left alone."""
+    request = get_request("first")
+    os.makedirs(os.path.join(deploy_home, "first", "1.0.0", "bin"))
+    open(os.path.join(deploy_home, "first", "1.0.0", "bin", "script.sh"), "w").close()
+    success, _, _ = handler.prepare_env(request)
+    assert not success
+    assert os.path.exists(os.path.join(deploy_home, "first", "1.0.0", "bin", "script.sh"))
+
+
+def test_legacy_environment_is_replaced(deploy_home):
+    """Test a venv built in the blueprint directory before environments were shared is replaced by the links."""
+    request = get_request("first")
+    venv_home = os.path.join(deploy_home, "first", "1.0.0")
+    os.makedirs(os.path.join(venv_home, "bin"))
+    open(os.path.join(venv_home, "pyvenv.cfg"), "w").close()
+    prepare(request)
+    for name in ("bin", "pyvenv.cfg"):
+        assert os.path.islink(os.path.join(venv_home, name))
+
+
+
+@pytest.fixture
+def installs(monkeypatch):
+    # The pip packages each install was asked for
+    installs = []
+    install_python_packages = handler.CommandExecutorHandler.install_python_packages
+
+    def record(self, packages, results, manifest):
+        installs.append([os.path.basename(package) for package in packages])
+        return install_python_packages(self, packages, results, manifest)
+
+    monkeypatch.setattr(handler.CommandExecutorHandler, "install_python_packages", record)
+    return installs
+
+
+def test_interrupted_environment_is_resumed(deploy_home, tmp_path, installs):
+    """Test an environment left half way is resumed, installing only the packages its manifest does not list."""
+    first, second = make_wheel(tmp_path, "first", "1.0"), make_wheel(tmp_path, "second", "1.0")
+    request = get_request("blueprint", pip=[first, second])
+    prepare(request)
+    env_home = get_env_home(request)
+    # As if the executor stopped before installing the second package
+    os.remove(os.path.join(env_home, ".installed"))
+    os.remove(os.path.join(deploy_home, "blueprint", "1.0.0", ".installed"))
+    Manifest(env_home).discard(handler.PIP, [second])
+
+    assert "Resuming shared environment" in prepare(request)
+    assert installs == [[os.path.basename(first), os.path.basename(second)], [os.path.basename(second)]]
+    assert Manifest(env_home).get_missing(handler.PIP, [first, second]) == []
+
+
+def test_utilities_are_refreshed(deploy_home):
+    """Test a reused environment built with other cds_utils gets the ones of this executor."""
+    prepare(get_request("first"))
+    env_home = get_env_home(get_request("first"))
+    Manifest(env_home).set("utilities", "previous")
+    site_packages = env_home + "/lib/python%s.%s/site-packages" % sys.version_info[:2]
+    shutil.rmtree(os.path.join(site_packages, "cds_utils"))
+
+    prepare(get_request("second"))
+    assert Manifest(env_home).get("utilities") == handler.CDS_UTILS_HASH
+    assert os.path.exists(os.path.join(site_packages, "cds_utils", "payload_coder.py"))
+
+
+def test_new_version_derives_environment(deploy_home, tmp_path, installs):
+    """Test a new blueprint version starts from the environment of the previous one, leaving it untouched."""
+    first, second = make_wheel(tmp_path, "first", "1.0"), make_wheel(tmp_path, "second", "1.0")
+    prepare(get_request("blueprint", "1.0.0", [first]))
+    results = prepare(get_request("blueprint", "2.0.0", [first, second]))
+
+    assert "Deriving shared environment" in results
+    assert installs == [[os.path.basename(first)], [os.path.basename(second)]]
+    previous, derived = (get_env_home(get_request("blueprint", version)) for version in ("1.0.0", "2.0.0"))
+    assert previous != derived
+    site_packages = "/lib/python%s.%s/site-packages" % sys.version_info[:2]
+    assert not os.path.exists(previous + site_packages + "/second")
+    assert os.path.exists(derived + site_packages + "/second")
+    with open(os.path.join(derived, "bin", "pip")) as f:
+        assert f.readline().startswith("#!%s/bin/python" % derived)
+
+
+def test_inheritance_disabled(deploy_home, tmp_path, installs, monkeypatch):
+    """Test a new blueprint version builds its environment from scratch without inheritance."""
+    monkeypatch.setattr(handler, "ENV_INHERITANCE", False)
+    first, second = make_wheel(tmp_path, "first", "1.0"), make_wheel(tmp_path, "second", "1.0")
+    prepare(get_request("blueprint", "1.0.0", [first]))
+    assert "Deriving shared environment" not in prepare(get_request("blueprint", "2.0.0", [first, second]))
+    assert installs == [[os.path.basename(first)], [os.path.basename(first), os.path.basename(second)]]
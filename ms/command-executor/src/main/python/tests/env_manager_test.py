@@ -0,0 +1,62 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+
+from env_manager import EnvironmentManager
+
+
+def make_blueprint(deploy_home, name, env_home=None, installed=True):
+    venv_home = os.path.join(deploy_home, name, "1.0.0")
+    os.makedirs(venv_home)
+    if env_home:
+        os.makedirs(env_home + "/bin", exist_ok=True)
+        os.symlink(env_home + "/bin", venv_home + "/bin")
+    if installed:
+        open(venv_home + "/.installed", "w").close()
+    return venv_home
+
+
+def test_blueprint_in_use_is_not_evicted(tmp_path):
+    """Test the least recently used blueprint is evicted over budget, unless a request is using it."""
+    deploy_home, shared_home = str(tmp_path / "deploy"), str(tmp_path / "envs")
+    manager = EnvironmentManager(deploy_home, shared_home, ["bin"], max_count=1)
+    first = make_blueprint(deploy_home, "first", shared_home + "/a")
+    second = make_blueprint(deploy_home, "second", shared_home + "/b")
+    os.utime(first + "/.installed", (1, 1))
+
+    with manager.using(first):
+        manager.evict()
+    assert os.path.exists(first + "/.installed")
+    assert not os.path.exists(second + "/.installed")
+    assert not os.path.lexists(second + "/bin")
+    assert os.path.exists(shared_home + "/a")
+    assert not os.path.exists(shared_home + "/b")
+
+
+def test_shared_env_linked_during_collection_is_kept(tmp_path):
+    """Test a shared environment linked by a blueprint being prepared is not collected."""
+    deploy_home, shared_home = str(tmp_path / "deploy"), str(tmp_path / "envs")
+    manager = EnvironmentManager(deploy_home, shared_home, ["bin"])
+    os.makedirs(shared_home + "/unused")
+    preparing = make_blueprint(deploy_home, "preparing", shared_home + "/linked", installed=False)
+
+    with manager.using(preparing):
+        manager.collect_shared_envs()
+    assert os.path.exists(shared_home + "/linked")
+    assert not os.path.exists(shared_home + "/unused")
+
+    manager.collect_shared_envs()
+    assert not os.path.exists(shared_home + "/linked")
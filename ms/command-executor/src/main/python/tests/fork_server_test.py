@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import fork_server
+from fork_server import PAYLOAD_FD_ENV, ForkServerClient
+
+
+@pytest.fixture
+def client(tmp_path):
+    # A fork server running the interpreter of the tests, as if it was the one of a blueprint venv
+    os.makedirs(str(tmp_path / "env" / "bin"))
+    os.symlink(sys.executable, str(tmp_path / "env" / "bin" / "python"))
+    client = ForkServerClient(str(tmp_path / "env"), {"PATH": os.environ.get("PATH", "")})
+    yield client
+    client.stop()
+
+
+def write_script(tmp_path, code):
+    path = str(tmp_path / "script.py")
+    with open(path, "w") as f:
+        f.write(code)
+    return path
+
+
+def test_forked_command(client, tmp_path):
+    """Test a forked command gets its own argv, environment and working directory, and reports its output and code."""
+    script = write_script(tmp_path, "import os, sys\n"
+                                    "print(sys.argv[1:], os.environ['NAME'], os.getcwd())\n"
+                                    "sys.exit(3)\n")
+    with client.spawn(script, [script, "--flag"], str(tmp_path), {"NAME": "value"}) as process:
+        output = process.stdout.read().decode()
+        assert process.wait(5) == 3
+    assert output == "['--flag'] value {}\n".format(tmp_path)
+
+
+def test_payload_descriptor(client, tmp_path):
+    """Test the payload pipe is handed over to the forked command, named by its environment."""
+    script = write_script(tmp_path, "import os\n"
+                                    "os.write(int(os.environ['{}']), b'payload')\n".format(PAYLOAD_FD_ENV))
+    read_fd, write_fd = os.pipe()
+    with client.spawn(script, [script], str(tmp_path), {}, write_fd) as process:
+        os.close(write_fd)
+        assert process.wait(5) == 0
+    with os.fdopen(read_fd, "rb") as f:
+        assert f.read() == b"payload"
+
+
+def test_killed_command(client, tmp_path):
+    """Test a command killed through its process group reports the signal."""
+    script = write_script(tmp_path, "import time\ntime.sleep(30)\n")
+    with client.spawn(script, [script], str(tmp_path), {}) as process:
+        with pytest.raises(subprocess.TimeoutExpired):
+            process.wait(0.2)
+        os.killpg(process.pid, signal.SIGTERM)
+        assert process.wait(5) == -signal.SIGTERM
+    assert client.is_alive()
+
+
+def test_idle_server_exits(tmp_path, monkeypatch):
+    """Test a server without any command to run for the idle timeout exits and removes its socket."""
+    monkeypatch.setattr(fork_server, "FORK_SERVER_IDLE_TIMEOUT", 0.5)
+    os.makedirs(str(tmp_path / "env" / "bin"))
+    os.symlink(sys.executable, str(tmp_path / "env" / "bin" / "python"))
+    client = ForkServerClient(str(tmp_path / "env"), {})
+    try:
+        client.process.wait(10)
+        assert not client.is_alive()
+        assert not os.path.exists(client.socket_path)
+    finally:
+        client.stop()
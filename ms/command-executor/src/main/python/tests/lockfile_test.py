@@ -0,0 +1,69 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import os
+
+from lockfile import LOCK_HEADER, Lockfiles
+from wheelhouse import Wheelhouse
+
+FREEZE = "# editable install\nsix==1.16.0\nPyYAML==6.0\n\n"
+
+
+def add_wheel(wheelhouse, name):
+    path = os.path.join(wheelhouse.home, name)
+    with open(path, "wb") as f:
+        f.write(name.encode())
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def read_lock(lockfiles, env_hash):
+    with open(lockfiles.get_path(env_hash)) as f:
+        return f.read().splitlines()
+
+
+def test_lock_with_hashes(tmp_path):
+    """Test every pin carries the hashes of the wheelhouse wheels it was installed from."""
+    lockfiles = Lockfiles(str(tmp_path / "locks"))
+    wheelhouse = Wheelhouse(str(tmp_path))
+    six = add_wheel(wheelhouse, "six-1.16.0-py2.py3-none-any.whl")
+    yaml = add_wheel(wheelhouse, "PyYAML-6.0-cp38-cp38-linux_x86_64.whl")
+    add_wheel(wheelhouse, "six-1.15.0-py2.py3-none-any.whl")
+
+    lockfiles.save("env", FREEZE, wheelhouse)
+    assert lockfiles.is_locked("env")
+    assert read_lock(lockfiles, "env") == [LOCK_HEADER, "six==1.16.0 --hash=sha256:%s" % six,
+                                           "PyYAML==6.0 --hash=sha256:%s" % yaml]
+
+
+def test_lock_without_hashes(tmp_path):
+    """Test no pin carries hashes when one of them has no wheel, or without wheelhouse."""
+    lockfiles = Lockfiles(str(tmp_path / "locks"))
+    wheelhouse = Wheelhouse(str(tmp_path))
+    add_wheel(wheelhouse, "six-1.16.0-py2.py3-none-any.whl")
+    lockfiles.save("env", FREEZE, wheelhouse)
+    assert read_lock(lockfiles, "env") == [LOCK_HEADER, "six==1.16.0", "PyYAML==6.0"]
+
+    lockfiles.save("env", FREEZE, Wheelhouse(""))
+    assert read_lock(lockfiles, "env") == [LOCK_HEADER, "six==1.16.0", "PyYAML==6.0"]
+
+
+def test_empty_lock_is_not_locked(tmp_path):
+    """Test a missing lock, or one without any requirement left, does not count as locked."""
+    lockfiles = Lockfiles(str(tmp_path / "locks"))
+    assert not lockfiles.is_locked("env")
+    lockfiles.save("env", "", Wheelhouse(""))
+    assert not lockfiles.is_locked("env")
+    assert not Lockfiles("").is_enabled()
@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from manifest import MANIFEST, Manifest
+
+
+def test_missing_entries(tmp_path):
+    """Test only the entries not installed yet are missing, in the requested order."""
+    manifest = Manifest(str(tmp_path))
+    manifest.add("pip", ["requests==2.22.0", "six"])
+    assert manifest.get_missing("pip", ["six", "pyyaml", "requests==2.22.0", "requests==2.23.0"]) == [
+        "pyyaml", "requests==2.23.0"]
+    assert manifest.get_missing("ansible_galaxy", ["role"]) == ["role"]
+
+
+def test_changes_are_saved(tmp_path):
+    """Test every change is saved right away."""
+    manifest = Manifest(str(tmp_path))
+    assert not manifest.exists()
+    manifest.set("python", "3.6")
+    manifest.add("pip", ["six", "pyyaml"])
+    manifest.add("pip", ["six"])
+    manifest.discard("pip", ["pyyaml"])
+
+    reloaded = Manifest(str(tmp_path))
+    assert reloaded.exists()
+    assert reloaded.get("python") == "3.6"
+    assert reloaded.get("pip") == ["six"]
+
+
+def test_unreadable_manifest_is_empty(tmp_path):
+    """Test a corrupted manifest is treated as an empty one, so everything gets installed again."""
+    (tmp_path / MANIFEST).write_text("{not json")
+    manifest = Manifest(str(tmp_path))
+    assert manifest.get("pip") is None
+    assert manifest.get_missing("pip", ["six"]) == ["six"]
@@ -0,0 +1,77 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+
+from output_capture import LineDecoder, OutputCapture
+
+
+def capture(lines, max_bytes, spill_home=None, name="1234"):
+    results = []
+    output = OutputCapture(results, name, max_bytes=max_bytes, spill_home=spill_home)
+    for line in lines:
+        output.append(line)
+    output.close()
+    return results, output
+
+
+def test_output_within_the_limit_is_kept():
+    """Test all the lines are kept when they fit."""
+    lines = ["line %d" % i for i in range(10)]
+    results, output = capture(lines, 1024)
+    assert results == lines
+    assert output.omitted_bytes == 0
+
+
+def test_head_and_tail_are_kept():
+    """Test only the head and the tail of a large output are kept, with the size of what was left out."""
+    lines = ["line %03d" % i for i in range(100)]
+    results, output = capture(lines, 100)
+    omitted = [line for line in results if line.startswith("...")]
+    assert omitted == ["... %d bytes of output omitted ..." % output.omitted_bytes]
+    head = results[:results.index(omitted[0])]
+    tail = results[results.index(omitted[0]) + 1:]
+    assert head == lines[:len(head)]
+    assert tail == lines[-len(tail):]
+    assert sum(len(line) + 1 for line in head + tail) <= 100
+    assert output.omitted_bytes == sum(len(line) + 1 for line in lines) - sum(len(line) + 1 for line in head + tail)
+
+
+def test_large_output_is_spilled(tmp_path):
+    """Test the whole output of a large output ends up in the spill file it points at."""
+    lines = ["line %03d" % i for i in range(100)]
+    results, output = capture(lines, 100, str(tmp_path))
+    assert "full output in %s" % output.spill_path in "\n".join(results)
+    with open(output.spill_path) as f:
+        assert f.read().splitlines() == lines
+
+
+def test_spill_file_stays_in_the_spill_directory(tmp_path):
+    """Test a request id with path separators does not move the spill file elsewhere."""
+    spill_home = tmp_path / "spill"
+    results, output = capture(["x" * 50] * 10, 100, str(spill_home), name="../../escaped")
+    assert os.path.dirname(output.spill_path) == str(spill_home)
+    assert os.listdir(str(tmp_path)) == ["spill"]
+
+
+def test_lines_split_across_chunks():
+    """Test lines and multi-byte characters split across chunks are decoded whole."""
+    decoder = LineDecoder()
+    data = "première\nligne\nfin".encode()
+    lines = []
+    for i in range(len(data)):
+        lines += decoder.decode(data[i:i + 1])
+    lines += decoder.decode(b"", final=True)
+    assert lines == ["première", "ligne", "fin"]
@@ -0,0 +1,70 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import subprocess
+import sys
+
+from payload_channel import PAYLOAD_FD_ENV, PayloadChannel
+
+CDS_UTILS_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEND = "from cds_utils.payload_coder import send_response_data_payload; send_response_data_payload({})"
+
+
+def run(code, channel):
+    env = {**os.environ, "PYTHONPATH": CDS_UTILS_PARENT, PAYLOAD_FD_ENV: str(channel.write_fd)}
+    process = subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE,
+                               pass_fds=(channel.write_fd,))
+    channel.start()
+    stdout = process.communicate()[0].decode()
+    return stdout, channel.get_payload()
+
+
+def test_last_payload_wins():
+    """Test the payloads sent through the channel are decoded, the last one wins."""
+    # Larger than the pipe buffer
+    code = "{}; {}".format(SEND.format("{'first': 1}"), SEND.format("{'second': 'x' * 1024 * 1024}"))
+    stdout, payload = run(code, PayloadChannel())
+    assert stdout == ""
+    assert payload == {"second": "x" * 1024 * 1024}
+
+
+def test_no_payload():
+    """Test no payload is reported when the command did not send any."""
+    assert run("print('done')", PayloadChannel()) == ("done\n", None)
+
+
+def test_descriptor_reused_by_child_falls_back_to_stdout(tmp_path):
+    """Test a child which had the descriptor closed and reused for a file sends the payload on stdout instead."""
+    channel = PayloadChannel()
+    code = "import os; os.dup2(os.open({path!r}, os.O_CREAT | os.O_WRONLY), {fd}); {send}".format(
+        fd=channel.write_fd, path=str(tmp_path / "unrelated"), send=SEND.format("{'key': 'value'}"))
+    stdout, payload = run(code, channel)
+    assert payload is None
+    assert "BEGIN_EXTRA_PAYLOAD" in stdout and '{"key": "value"}' in stdout
+    assert (tmp_path / "unrelated").read_text() == ""
+
+
+def test_close_without_command():
+    """Test a channel closed before the command started releases both ends."""
+    channel = PayloadChannel()
+    read_fd, write_fd = channel.read_fd, channel.write_fd
+    channel.close()
+    for fd in (read_fd, write_fd):
+        try:
+            os.fstat(fd)
+            assert False, "descriptor {} still open".format(fd)
+        except OSError:
+            pass
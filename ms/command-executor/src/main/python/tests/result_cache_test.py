@@ -0,0 +1,143 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import time
+
+import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+from result_cache import IDEMPOTENCY_KEY, ResultCache
+
+
+def get_request(command="echo hello"):
+    return CommandExecutor_pb2.ExecutionInput(
+        requestId="1234", command=command,
+        identifiers=CommandExecutor_pb2.Identifiers(blueprintName="test", blueprintVersion="1.0.0"))
+
+
+def get_metadata(idempotency_key="retry-1"):
+    return [("authorization", "Basic xxx"), (IDEMPOTENCY_KEY, idempotency_key)]
+
+
+def get_response(status=CommandExecutor_pb2.SUCCESS, response=()):
+    return CommandExecutor_pb2.ExecutionOutput(requestId="1234", status=status, response=list(response))
+
+
+def test_no_key_when_disabled():
+    """Test requests are never cached without a TTL."""
+    assert ResultCache(ttl=0).get_key(get_request(), get_metadata()) is None
+
+
+def test_no_key_without_idempotency_key():
+    """Test requests are only cached when the client sends an idempotency key."""
+    cache = ResultCache(ttl=60)
+    assert cache.get_key(get_request(), []) is None
+    assert cache.get_key(get_request(), get_metadata("")) is None
+
+
+def test_request_key():
+    """Test requests without idempotency key are cached by request and correlation id when enabled."""
+    cache = ResultCache(ttl=60, request_key=True)
+    key = cache.get_key(get_request(), [])
+    assert key is not None and key == cache.get_key(get_request(), [])
+    assert key != cache.get_key(get_request(), get_metadata())
+    assert key != cache.get_key(get_request("echo bye"), [])
+    other = get_request()
+    other.correlationId = "5678"
+    assert key != cache.get_key(other, [])
+    other.requestId = ""
+    assert cache.get_key(other, []) is None
+
+
+def test_key_tells_requests_apart():
+    """Test retries of a request share a key and different requests do not."""
+    cache = ResultCache(ttl=60)
+    key = cache.get_key(get_request(), get_metadata())
+    assert key == cache.get_key(get_request(), get_metadata())
+    assert key != cache.get_key(get_request("echo bye"), get_metadata())
+    assert key != cache.get_key(get_request(), get_metadata("retry-2"))
+
+
+def test_retry_attaches_to_the_running_execution():
+    """Test a retry waits for the execution of the first request and gets its response."""
+    cache = ResultCache(ttl=60)
+    key = cache.get_key(get_request(), get_metadata())
+    assert cache.claim(key) is None
+    execution = cache.claim(key)
+    assert not execution.done()
+    cache.complete(key, get_response())
+    assert execution.result(0) == get_response()
+    assert cache.claim(key).result(0) == get_response()
+
+
+def test_execution_without_response_runs_again():
+    """Test the requests attached to an execution without response are told to run it again."""
+    cache = ResultCache(ttl=60)
+    key = cache.get_key(get_request(), get_metadata())
+    cache.claim(key)
+    execution = cache.claim(key)
+    cache.complete(key, None)
+    assert execution.result(0) is None
+    assert cache.claim(key) is None
+
+
+def test_failure_is_not_kept():
+    """Test the requests attached to a failed execution get its failure, later retries run again."""
+    cache = ResultCache(ttl=60)
+    key = cache.get_key(get_request(), get_metadata())
+    cache.claim(key)
+    execution = cache.claim(key)
+    cache.complete(key, get_response(CommandExecutor_pb2.FAILURE))
+    assert execution.result(0).status == CommandExecutor_pb2.FAILURE
+    assert cache.claim(key) is None
+
+
+def test_result_expires():
+    """Test a result is dropped after the TTL."""
+    cache = ResultCache(ttl=0.05)
+    key = cache.get_key(get_request(), get_metadata())
+    cache.claim(key)
+    cache.complete(key, get_response())
+    time.sleep(0.1)
+    assert cache.claim(key) is None
+
+
+def test_oldest_result_dropped_over_the_limit():
+    """Test the least recently used result goes first and running executions are kept."""
+    cache = ResultCache(ttl=60, max_entries=2)
+    running = cache.get_key(get_request("running"), get_metadata())
+    done = cache.get_key(get_request("done"), get_metadata())
+    cache.claim(running)
+    cache.claim(done)
+    cache.complete(done, get_response())
+    cache.claim(cache.get_key(get_request("new"), get_metadata()))
+    assert cache.claim(done) is None
+    assert cache.claim(running) is not None
+
+
+def test_results_kept_within_the_byte_budget():
+    """Test results are dropped, oldest first, to stay within the byte budget, and larger ones are never kept."""
+    response = get_response(response=["x" * 100])
+    cache = ResultCache(ttl=60, max_bytes=2 * response.ByteSize())
+    keys = [cache.get_key(get_request(str(i)), get_metadata()) for i in range(3)]
+    for key in keys:
+        cache.claim(key)
+        cache.complete(key, response)
+    assert cache.size == 2 * response.ByteSize()
+    assert cache.claim(keys[0]) is None
+    assert cache.claim(keys[2]) is not None
+
+    large = cache.get_key(get_request("large"), get_metadata())
+    cache.claim(large)
+    cache.complete(large, get_response(response=["x" * 1000]))
+    assert cache.claim(large) is None
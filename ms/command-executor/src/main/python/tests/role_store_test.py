@@ -0,0 +1,99 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import shutil
+
+from role_store import RoleStore
+
+
+def installer(*names):
+    # Stands in for ansible-galaxy, installing the role and its dependencies into path
+    def install(path):
+        for name in names:
+            os.makedirs(os.path.join(path, name, "tasks"))
+        return True
+    return install
+
+
+def test_role_is_stored_once(tmp_path):
+    """Test a role is installed once, then linked into every roles path asking for it."""
+    store = RoleStore(str(tmp_path / "store"))
+    calls = []
+
+    def install(path):
+        calls.append(path)
+        return installer("role")(path)
+
+    for blueprint in ("first", "second"):
+        roles_path = str(tmp_path / blueprint)
+        assert store.fill("role,1.0", install)
+        store.link("role,1.0", roles_path)
+        assert store.is_linked("role,1.0", roles_path)
+        assert os.path.exists(os.path.join(roles_path, "role", "tasks"))
+    assert len(calls) == 1
+
+
+def test_failed_install_is_not_stored(tmp_path):
+    """Test a failed install leaves nothing behind."""
+    store = RoleStore(str(tmp_path / "store"))
+    assert not store.fill("role", lambda path: False)
+    assert not store.is_stored("role")
+    assert os.listdir(str(tmp_path / "store")) == []
+
+
+def test_roles_sharing_a_dependency(tmp_path):
+    """Test roles installing the same dependency are both linked, whichever entry the dependency links to."""
+    store = RoleStore(str(tmp_path / "store"))
+    roles_path = str(tmp_path / "roles")
+    assert store.fill("first", installer("first", "common"))
+    assert store.fill("second", installer("second", "common"))
+    store.link("first", roles_path)
+    store.link("second", roles_path)
+    assert store.is_linked("first", roles_path)
+    assert store.is_linked("second", roles_path)
+
+    # Invalidating the entry the dependency links to relinks it from the other one
+    os.remove(os.path.join(os.readlink(os.path.join(roles_path, "common")), "..", ".installed"))
+    invalidated = "first" if not store.is_stored("first") else "second"
+    remaining = "second" if invalidated == "first" else "first"
+    assert not store.is_linked(remaining, roles_path)
+    store.link(remaining, roles_path)
+    assert store.is_linked(remaining, roles_path)
+    assert os.path.realpath(os.path.join(roles_path, "common")).startswith(store.get_path(remaining))
+
+
+def test_invalidated_entry_is_installed_again(tmp_path):
+    """Test deleting an entry invalidates the links to it, and the next fill installs it again."""
+    store = RoleStore(str(tmp_path / "store"))
+    roles_path = str(tmp_path / "roles")
+    assert store.fill("role", installer("role"))
+    store.link("role", roles_path)
+    shutil.rmtree(store.get_path("role"))
+    assert not store.is_linked("role", roles_path)
+    assert store.fill("role", installer("role"))
+    store.link("role", roles_path)
+    assert store.is_linked("role", roles_path)
+
+
+def test_blueprint_role_keeps_precedence(tmp_path):
+    """Test a role shipped in the blueprint is not replaced by the stored one."""
+    store = RoleStore(str(tmp_path / "store"))
+    roles_path = str(tmp_path / "roles")
+    os.makedirs(os.path.join(roles_path, "role"))
+    assert store.fill("role", installer("role"))
+    store.link("role", roles_path)
+    assert not os.path.islink(os.path.join(roles_path, "role"))
+    assert store.is_linked("role", roles_path)
@@ -0,0 +1,91 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as err:
+            results[index] = err
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_the_result():
+    """Test concurrent calls for the same key run it once and all get its result."""
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def install():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "installed"
+
+    threads, results = run_concurrently(1, lambda: flights.do("env", install))
+    started.wait(5)
+    waiters, waiter_results = run_concurrently(3, lambda: flights.do("env", install))
+    # Lets the waiters reach the flight before it lands
+    time.sleep(0.2)
+    release.set()
+    for thread in threads + waiters:
+        thread.join(5)
+    assert results + waiter_results == ["installed"] * 4
+    assert len(calls) == 1
+
+
+def test_error_is_shared_and_not_kept():
+    """Test callers waiting on a failed call get its error, and the next call runs again."""
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("install failed")
+
+    threads, results = run_concurrently(1, lambda: flights.do("env", fail))
+    started.wait(5)
+    waiters, waiter_results = run_concurrently(2, lambda: flights.do("env", fail))
+    release.set()
+    for thread in threads + waiters:
+        thread.join(5)
+    assert all(isinstance(result, RuntimeError) for result in results + waiter_results)
+    assert flights.do("env", lambda: "retried") == "retried"
+
+
+def test_keys_do_not_wait_for_each_other():
+    """Test a call for another key runs while the first one is still running."""
+    flights = SingleFlight()
+    release = threading.Event()
+    threads, results = run_concurrently(1, lambda: flights.do("first", lambda: release.wait(5)))
+    assert flights.do("second", lambda: "second") == "second"
+    release.set()
+    threads[0].join(5)
+    assert results == [True]
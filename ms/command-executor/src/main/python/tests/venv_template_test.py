@@ -0,0 +1,73 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import subprocess
+
+from venv_template import VenvTemplate
+
+
+def make_env(path, installed=True):
+    os.makedirs(os.path.join(path, "bin"))
+    with open(os.path.join(path, "bin", "tool"), "w") as f:
+        f.write("#!%s/bin/python\nprint('tool')\n" % path)
+    os.chmod(os.path.join(path, "bin", "tool"), 0o755)
+    os.symlink("/usr/bin/python3", os.path.join(path, "bin", "python"))
+    if installed:
+        open(os.path.join(path, ".installed"), "w").close()
+
+
+def test_derive_relocates_scripts(tmp_path):
+    """Test a derived environment has its scripts pointing at itself, and leaves its source untouched."""
+    source, env_home = str(tmp_path / "source"), str(tmp_path / "envs" / "derived")
+    make_env(source)
+    VenvTemplate(str(tmp_path / "template")).derive(source, env_home)
+
+    with open(os.path.join(env_home, "bin", "tool")) as f:
+        assert f.readline() == "#!%s/bin/python\n" % env_home
+    assert os.access(os.path.join(env_home, "bin", "tool"), os.X_OK)
+    assert os.readlink(os.path.join(env_home, "bin", "python")) == "/usr/bin/python3"
+    with open(os.path.join(source, "bin", "tool")) as f:
+        assert f.readline() == "#!%s/bin/python\n" % source
+    # Published by the caller once the environment is complete
+    assert not os.path.exists(os.path.join(env_home, ".installed"))
+    assert os.listdir(str(tmp_path / "envs")) == ["derived"]
+
+
+def test_derive_replaces_leftovers(tmp_path):
+    """Test deriving over a half-built environment and the copy of an interrupted run starts from scratch."""
+    source, env_home = str(tmp_path / "source"), str(tmp_path / "envs" / "derived")
+    make_env(source)
+    make_env(env_home, installed=False)
+    make_env(str(tmp_path / "envs" / ".derived.tmp"))
+    open(os.path.join(env_home, "leftover"), "w").close()
+    VenvTemplate(str(tmp_path / "template")).derive(source, env_home)
+    assert not os.path.exists(os.path.join(env_home, "leftover"))
+    assert os.listdir(str(tmp_path / "envs")) == ["derived"]
+
+
+def test_materialize(tmp_path):
+    """Test environments are cloned from a template created once, with a working pip."""
+    template = VenvTemplate(str(tmp_path / "template"))
+    for name in ("first", "second"):
+        template.materialize(str(tmp_path / name))
+    assert template.is_installed()
+    created = os.stat(template.installed).st_mtime_ns
+    template.materialize(str(tmp_path / "third"))
+    assert os.stat(template.installed).st_mtime_ns == created
+
+    pip = str(tmp_path / "second" / "bin" / "pip")
+    output = subprocess.run([pip, "--version"], check=True, stdout=subprocess.PIPE).stdout.decode()
+    assert str(tmp_path / "second") in output
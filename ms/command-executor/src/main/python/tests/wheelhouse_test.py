@@ -0,0 +1,94 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import threading
+
+from wheelhouse import SharedLock, Wheelhouse
+
+
+def test_shared_holders_exclude_exclusive():
+    """Test the lock is held shared by several holders at once, and exclusively only once they are all gone."""
+    lock = SharedLock()
+    with lock.shared() as first, lock.shared(0) as second:
+        assert first and second
+        with lock.exclusive(0.1) as acquired:
+            assert not acquired
+    with lock.exclusive(0) as acquired:
+        assert acquired
+        with lock.shared(0.1) as acquired:
+            assert not acquired
+
+
+def test_waiting_exclusive_goes_first():
+    """Test new shared holders wait behind an exclusive holder already waiting."""
+    lock = SharedLock()
+    acquired = []
+
+    def exclusive():
+        with lock.exclusive(5) as result:
+            acquired.append(result)
+
+    with lock.shared():
+        thread = threading.Thread(target=exclusive)
+        thread.start()
+        with lock._condition:
+            lock._condition.wait_for(lambda: lock._exclusive_waiting, 5)
+        with lock.shared(0.1) as shared:
+            assert not shared
+    thread.join(5)
+    assert acquired == [True]
+    with lock.shared(0) as shared:
+        assert shared
+
+
+def test_fills_of_the_same_requirements_run_one_at_a_time():
+    """Test a fill waits for the one of the same requirements, not for the others."""
+    wheelhouse = Wheelhouse("/unused")
+    with wheelhouse.filling(["six"]) as first:
+        assert first
+        with wheelhouse.filling(["six"], 0.1) as second:
+            assert not second
+        with wheelhouse.filling(["pyyaml"], 0) as other:
+            assert other
+    with wheelhouse.filling(["six"], 0) as again:
+        assert again
+    assert wheelhouse._fill_locks == {}
+
+
+def test_evict_least_recently_used(tmp_path):
+    """Test eviction removes the least recently used wheels until under the maximum size, the touched ones last."""
+    wheelhouse = Wheelhouse(str(tmp_path), max_size_mb=1)
+    for age, name in enumerate(["six-1.0-py3-none-any.whl", "PyYAML-5.1-py3-none-any.whl",
+                                "requests-2.22-py3-none-any.whl"]):
+        path = str(tmp_path / name)
+        with open(path, "wb") as f:
+            f.write(b"0" * 512 * 1024)
+        os.utime(path, (age, age))
+    wheelhouse.touch(["six==1.0"])
+    wheelhouse.evict(0)
+    assert sorted(wheelhouse.list_wheels()) == ["requests-2.22-py3-none-any.whl", "six-1.0-py3-none-any.whl"]
+
+
+def test_evict_waits_for_pip_runs(tmp_path):
+    """Test eviction is skipped while pip runs hold the wheelhouse past the timeout."""
+    wheelhouse = Wheelhouse(str(tmp_path), max_size_mb=0)
+    with open(str(tmp_path / "six-1.0-py3-none-any.whl"), "w") as f:
+        f.write("wheel")
+    with wheelhouse.usage.shared():
+        wheelhouse.evict(0.1)
+    assert wheelhouse.list_wheels() == ["six-1.0-py3-none-any.whl"]
+    wheelhouse.evict(0)
+    assert wheelhouse.list_wheels() == []
@@ -16,7 +16,27 @@
 from google.protobuf.timestamp_pb2 import Timestamp
 
 import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+import asyncio
+import hashlib
 import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+
+# Characters that need a shell to be interpreted; commands without any can be launched from a plain argv
+SHELL_SYNTAX = re.compile(r'[;&|<>$`(){}\[\]*?~!#\n\\]')
+
+# Time a command gets to exit after SIGTERM before its whole process group is killed
+KILL_GRACE_PERIOD = float(os.environ.get('CE_KILL_GRACE_PERIOD', '5'))
+
+PYTHON_VERSION = '%s.%s' % sys.version_info[:2]
+
+# Where the blueprints are deployed, the shared environments and caches live below it unless moved by their own setting
+BLUEPRINTS_DEPLOY_HOME = os.path.join(os.environ.get('CE_BLUEPRINTS_DEPLOY_HOME', '/opt/app/onap/blueprints/deploy'),
+                                      '')
 
 def get_blueprint_id(request):
     blueprint_name = request.identifiers.blueprintName
@@ -24,9 +44,94 @@ def get_blueprint_id(request):
     return blueprint_name + '/' + blueprint_version
 
 
+def get_env_hash(request, requirements_path):
+    # Only the pip side defines the Python environment; ansible roles live in the blueprint directory itself.
+    pip_packages = set()
+    for package in request.packages:
+        if package.type == CommandExecutor_pb2.pip:
+            pip_packages.update(p.strip() for p in package.package if p.strip())
+
+    requirements = ''
+    if 'requirements.txt' in pip_packages:
+        requirements = get_requirements_hash(requirements_path)
+
+    env_key = {
+        'python': PYTHON_VERSION,
+        'pip': sorted(pip_packages),
+        'requirements': requirements
+    }
+    return hashlib.sha256(json.dumps(env_key, sort_keys=True).encode()).hexdigest()
+
+
+def get_requirements_hash(requirements_path):
+    if not os.path.exists(requirements_path):
+        return ''
+    with open(requirements_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_directory_hash(path):
+    # Content of the files under path, caches left by the interpreter aside
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode() + b'\0')
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def get_time_remaining(context):
+    # None when the RPC has no deadline, gRPC then reports a remaining time beyond what any wait accepts
+    remaining = context.time_remaining()
+    if remaining is None or remaining > threading.TIMEOUT_MAX:
+        return None
+    return remaining
+
+
+def has_shell_syntax(command):
+    return SHELL_SYNTAX.search(command) is not None
+
+
+def terminate_process_group(process, grace_period=KILL_GRACE_PERIOD):
+    # Commands are started in their own session, so signalling the group also reaches the processes they forked
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        process.wait(grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def terminate_process_group_async(process, grace_period=KILL_GRACE_PERIOD):
+    # terminate_process_group for an asyncio subprocess, waiting for it without blocking the event loop
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), grace_period)
+    except asyncio.TimeoutError:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
 def build_response(request, log_results, payload_return, is_success=False):
     if is_success:
         status = CommandExecutor_pb2.SUCCESS
+    elif payload_return.get('cds_timed_out'):
+        status = CommandExecutor_pb2.TIMEOUT
     else:
         status = CommandExecutor_pb2.FAILURE
 
@@ -35,6 +140,8 @@ def build_response(request, log_results, payload_return, is_success=False):
 
     if 'cds_return_code' in payload_return:
         payload_return.pop('cds_return_code')
+    if 'cds_timed_out' in payload_return:
+        payload_return.pop('cds_timed_out')
     payload_str = json.dumps(payload_return)
     return CommandExecutor_pb2.ExecutionOutput(requestId=request.requestId, response=log_results, status=status,
                                                payload=payload_str, timestamp=timestamp)
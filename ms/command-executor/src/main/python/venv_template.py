@@ -0,0 +1,106 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from subprocess import CalledProcessError, PIPE
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import venv
+
+from single_flight import SingleFlight
+from utils import BLUEPRINTS_DEPLOY_HOME
+
+VENV_TEMPLATE_HOME = os.environ.get('CE_VENV_TEMPLATE_HOME',
+                                    BLUEPRINTS_DEPLOY_HOME + '.venv-template-%s.%s' % sys.version_info[:2])
+
+
+class VenvTemplate:
+    """Pre-built base virtual environment that new environments are cloned from instead of bootstrapping pip."""
+
+    def __init__(self, home=VENV_TEMPLATE_HOME):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.home = home
+        self.installed = self.home + '/.installed'
+        self.flights = SingleFlight()
+
+    def is_installed(self):
+        return os.path.exists(self.installed)
+
+    def create(self):
+        if self.is_installed():
+            return
+        self.logger.info("Create Python Virtual Environment template in {}".format(self.home))
+        shutil.rmtree(self.home, ignore_errors=True)
+        venv.create(self.home, with_pip=True, system_site_packages=True)
+        open(self.installed, "w").close()
+
+    def materialize(self, env_home):
+        self.flights.do(self.home, self.create)
+        self.derive(self.home, env_home)
+
+    def derive(self, source, env_home):
+        # The new environment starts as a copy of an existing one, the template or a complete environment to extend.
+        # It is assembled under a hidden name, which shared environment eviction skips, and only renamed in place
+        # once its scripts point at it, so a crash never leaves behind a copy of the source's .installed marker.
+        env_home = env_home.rstrip('/')
+        tmp_home = os.path.join(os.path.dirname(env_home), '.%s.tmp' % os.path.basename(env_home))
+        shutil.rmtree(tmp_home, ignore_errors=True)
+        shutil.rmtree(env_home, ignore_errors=True)
+        os.makedirs(os.path.dirname(env_home), exist_ok=True)
+        self.clone(source, tmp_home)
+        os.remove(tmp_home + '/.installed')
+        self.relocate_scripts(source, env_home, tmp_home)
+        os.rename(tmp_home, env_home)
+
+    def clone(self, source, env_home):
+        # Reflinks give a private copy-on-write tree for free where the filesystem supports them (btrfs, xfs)
+        try:
+            subprocess.run(["cp", "-a", "--reflink=always", source, env_home], check=True, stdout=PIPE, stderr=PIPE)
+            return
+        except (CalledProcessError, OSError):
+            shutil.rmtree(env_home, ignore_errors=True)
+
+        # Hardlinks are safe as pip only ever replaces files, it never rewrites an installed file in place
+        try:
+            shutil.copytree(source, env_home, symlinks=True, copy_function=os.link)
+            return
+        except (shutil.Error, OSError):
+            shutil.rmtree(env_home, ignore_errors=True)
+
+        shutil.copytree(source, env_home, symlinks=True)
+
+    def relocate_scripts(self, source, env_home, location=None):
+        # Console script shebangs and activate scripts embed the absolute source path; rewrite them into new
+        # files so hardlinked source inodes are never modified. location is where the copy is until it is moved in
+        # place.
+        old_path = os.path.abspath(source).encode()
+        new_path = os.path.abspath(env_home).encode()
+        bin_dir = os.path.join(location or env_home, "bin")
+        for name in os.listdir(bin_dir):
+            path = os.path.join(bin_dir, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                content = f.read()
+            if old_path not in content:
+                continue
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content.replace(old_path, new_path))
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
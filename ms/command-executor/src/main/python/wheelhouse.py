@@ -0,0 +1,168 @@
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from contextlib import contextmanager
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from utils import BLUEPRINTS_DEPLOY_HOME
+
+WHEELHOUSE_HOME = os.environ.get('CE_WHEELHOUSE_HOME', BLUEPRINTS_DEPLOY_HOME + '.wheelhouse/')
+WHEELHOUSE_MAX_SIZE_MB = int(os.environ.get('CE_WHEELHOUSE_MAX_SIZE_MB', '2048'))
+# Air-gapped deployments never reach out to an index; the wheelhouse has to be seeded beforehand
+OFFLINE = os.environ.get('CE_OFFLINE', 'false') == "true"
+
+
+class SharedLock:
+    """Held shared by any number of threads or exclusively by one; a waiting exclusive holder goes first."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self, timeout=None):
+        # Yields whether the lock was acquired before the timeout
+        with self._condition:
+            acquired = self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting, timeout)
+            if acquired:
+                self._shared += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._condition:
+                    self._shared -= 1
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self, timeout=None):
+        # Yields whether the lock was acquired before the timeout
+        with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                acquired = self._condition.wait_for(lambda: not self._exclusive and not self._shared, timeout)
+            finally:
+                self._exclusive_waiting -= 1
+                if not acquired:
+                    self._condition.notify_all()
+            self._exclusive = acquired
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._condition:
+                    self._exclusive = False
+                    self._condition.notify_all()
+
+
+class Wheelhouse:
+    """Shared directory of built wheels that pip installs resolve from without any index access."""
+
+    def __init__(self, home=WHEELHOUSE_HOME, max_size_mb=WHEELHOUSE_MAX_SIZE_MB, offline=OFFLINE):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.home = home
+        self.max_size = max_size_mb * 1024 * 1024
+        self.offline = offline
+        # pip runs reading or adding wheels hold it shared, eviction removing wheels holds it exclusively
+        self.usage = SharedLock()
+        self._fill_locks = {}
+        self._fill_locks_lock = threading.Lock()
+
+    def is_enabled(self):
+        return bool(self.home)
+
+    def get_install_command(self, pip_args):
+        return ["pip", "install", "--no-index", "--find-links", self.home] + pip_args
+
+    def get_fill_command(self, pip_args):
+        return ["pip", "wheel", "--wheel-dir", self.home, "--find-links", self.home] + pip_args
+
+    @contextmanager
+    def filling(self, pip_args, timeout=None):
+        # Fills of the same requirements run one at a time, so the later ones find the wheels already built; fills
+        # of different requirements run side by side. Yields whether the fill lock was acquired before the timeout.
+        key = hashlib.sha256(json.dumps(pip_args).encode()).hexdigest()
+        with self._fill_locks_lock:
+            lock, users = self._fill_locks.get(key, (threading.Lock(), 0))
+            self._fill_locks[key] = (lock, users + 1)
+        try:
+            acquired = lock.acquire(timeout=-1 if timeout is None else timeout)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    lock.release()
+        finally:
+            with self._fill_locks_lock:
+                lock, users = self._fill_locks[key]
+                if users == 1:
+                    del self._fill_locks[key]
+                else:
+                    self._fill_locks[key] = (lock, users - 1)
+
+    def touch(self, packages):
+        # Keep the wheels of the requested packages at the young end of the eviction order
+        names = set()
+        for package in packages:
+            name = re.split(r'[<>=!~;\[\s]', package.strip(), 1)[0]
+            names.add(re.sub(r'[-_.]+', '_', name).lower())
+        for wheel in self.list_wheels():
+            if wheel.split('-', 1)[0].lower() in names:
+                try:
+                    os.utime(os.path.join(self.home, wheel))
+                except OSError:
+                    pass
+
+    def list_wheels(self):
+        try:
+            return [f for f in os.listdir(self.home) if f.endswith('.whl')]
+        except OSError:
+            return []
+
+    def evict(self, timeout=None):
+        # Waits for the pip runs using the wheelhouse to be over, eviction is skipped when they last past the timeout
+        with self.usage.exclusive(timeout) as acquired:
+            if acquired:
+                self._evict()
+
+    def _evict(self):
+        wheels = []
+        total = 0
+        for wheel in self.list_wheels():
+            path = os.path.join(self.home, wheel)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            wheels.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(wheels):
+            if total <= self.max_size:
+                break
+            self.logger.info("Evicting {} from wheelhouse".format(os.path.basename(path)))
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+#
+# Copyright (C) 2019 Bell Canada.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Benchmark of the command executor: runs the gRPC server in-process against synthetic blueprints and a local
+# directory of synthetic wheels standing in for the package index, and prints the results as JSON so they can be
+# diffed between releases.
+#
+#   python benchmark.py --output results.json
+#   python benchmark.py --server aio --concurrency 1,16,256 --output-sizes 1K,1M
+#
+# Measured:
+#   prepare_env       cold (new package set), shared (package set already built for another blueprint) and warm
+#                     (blueprint already prepared) prepareEnv latencies
+#   execute_command   throughput and latency percentiles of a small Python command per concurrency level
+#   output            latency, response size and server memory per command output size
+#
+# Every CE_* setting of the executor applies as usual, set them in the environment to benchmark a configuration.
+# The asyncio server runs on a background thread, which requires Python 3.8 or later for its subprocesses.
+#
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent import futures
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'main', 'python')
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+EMIT_SCRIPT = '''import sys
+size = int(sys.argv[1])
+line = 'x' * 99 + '\\n'
+chunk = line * 1000
+while size >= len(chunk):
+    sys.stdout.write(chunk)
+    size -= len(chunk)
+while size >= len(line):
+    sys.stdout.write(line)
+    size -= len(line)
+sys.stdout.write('x' * size)
+'''
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    if value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def percentile(values, percent):
+    # Nearest rank
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'min': min(latencies),
+        'mean': sum(latencies) / len(latencies),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies)
+    }
+
+
+def build_wheel(directory, name, version='1.0'):
+    # Smallest valid pure Python wheel, so installs exercise pip without any network access
+    module = name.replace('-', '_')
+    dist_info = '%s-%s.dist-info' % (module, version)
+    path = os.path.join(directory, '%s-%s-py3-none-any.whl' % (module, version))
+    files = {
+        module + '/__init__.py': 'VALUE = %r\n' % name,
+        dist_info + '/METADATA': 'Metadata-Version: 2.1\nName: %s\nVersion: %s\n' % (name, version),
+        dist_info + '/WHEEL': 'Wheel-Version: 1.0\nGenerator: benchmark\nRoot-Is-Purelib: true\nTag: py3-none-any\n',
+        dist_info + '/top_level.txt': module + '\n'
+    }
+    record = ''.join('%s,,\n' % file for file in files) + dist_info + '/RECORD,,\n'
+    with zipfile.ZipFile(path, 'w') as wheel:
+        for file, content in files.items():
+            wheel.writestr(file, content)
+        wheel.writestr(dist_info + '/RECORD', record)
+    return path
+
+
+class Benchmark:
+
+    def __init__(self, args):
+        self.args = args
+        self.home = tempfile.mkdtemp(prefix='ce-benchmark-')
+        self.deploy_home = os.path.join(self.home, 'deploy') + '/'
+        self.index = os.path.join(self.home, 'index')
+        os.makedirs(self.deploy_home)
+        os.makedirs(self.index)
+        self.blueprints = 0
+        # The configuration under test, before the benchmark points the executor at its own directories
+        self.settings = {key: value for key, value in sorted(os.environ.items()) if key.startswith('CE_')}
+
+        # The executor reads its settings at import time. Everything it writes goes to the benchmark directory, a
+        # cache disabled with an empty setting stays disabled.
+        os.environ['CE_BLUEPRINTS_DEPLOY_HOME'] = self.deploy_home
+        for key, path in [('CE_SHARED_ENV_HOME', self.deploy_home + '.envs/'),
+                          ('CE_WHEELHOUSE_HOME', self.deploy_home + '.wheelhouse/'),
+                          ('CE_VENV_TEMPLATE_HOME', self.deploy_home + '.venv-template/'),
+                          ('CE_LOCK_HOME', self.deploy_home + '.locks/'),
+                          ('CE_ROLE_STORE_HOME', self.deploy_home + '.roles/'),
+                          ('CE_OUTPUT_SPILL_HOME', os.path.join(self.home, 'command-output') + '/')]:
+            if os.environ.get(key) != '':
+                os.environ[key] = path
+        os.environ['PIP_NO_INDEX'] = '1'
+        os.environ['PIP_FIND_LINKS'] = self.index
+        os.environ['PIP_DISABLE_PIP_VERSION_CHECK'] = '1'
+        # cds_utils is copied from the working directory into every new environment, as in the container
+        os.chdir(SOURCES)
+        sys.path.insert(0, SOURCES)
+
+        import grpc
+        import proto.CommandExecutor_pb2 as CommandExecutor_pb2
+        import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
+        self.grpc = grpc
+        self.pb2 = CommandExecutor_pb2
+
+        port = self.start_aio_server() if args.server == 'aio' else self.start_server()
+        self.channel = grpc.insecure_channel('127.0.0.1:%d' % port)
+        self.stub = CommandExecutor_pb2_grpc.CommandExecutorServiceStub(self.channel)
+
+    def start_server(self):
+        from command_executor_server import CommandExecutorServer
+        import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
+        server = self.grpc.server(futures.ThreadPoolExecutor(max_workers=self.args.workers))
+        CommandExecutor_pb2_grpc.add_CommandExecutorServiceServicer_to_server(CommandExecutorServer(), server)
+        port = server.add_insecure_port('127.0.0.1:0')
+        server.start()
+        self.server = server
+        return port
+
+    def start_aio_server(self):
+        from grpc import aio
+        from command_executor_aio_server import AsyncCommandExecutorServer
+        import proto.CommandExecutor_pb2_grpc as CommandExecutor_pb2_grpc
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        ports = []
+
+        async def serve():
+            server = aio.server()
+            CommandExecutor_pb2_grpc.add_CommandExecutorServiceServicer_to_server(AsyncCommandExecutorServer(), server)
+            ports.append(server.add_insecure_port('127.0.0.1:0'))
+            await server.start()
+            started.set()
+            await server.wait_for_termination()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(serve())
+
+        threading.Thread(target=run, name='aio-server', daemon=True).start()
+        started.wait()
+        return ports[0]
+
+    def close(self):
+        self.channel.close()
+        if not self.args.keep:
+            shutil.rmtree(self.home, ignore_errors=True)
+
+    def create_blueprint(self):
+        self.blueprints += 1
+        name, version = 'benchmark%d' % self.blueprints, '1.0.0'
+        home = os.path.join(self.deploy_home, name, version)
+        os.makedirs(os.path.join(home, 'Scripts', 'python'))
+        os.makedirs(os.path.join(home, 'Environments'))
+        with open(os.path.join(home, 'Scripts', 'python', 'emit.py'), 'w') as f:
+            f.write(EMIT_SCRIPT)
+        return self.pb2.Identifiers(blueprintName=name, blueprintVersion=version)
+
+    def prepare_request(self, identifiers, packages):
+        return self.pb2.PrepareEnvInput(identifiers=identifiers, requestId='benchmark', timeOut=self.args.timeout,
+                                        packages=[self.pb2.Packages(type=self.pb2.pip, package=packages)])
+
+    def prepare(self, identifiers, packages):
+        start = time.monotonic()
+        response = self.stub.prepareEnv(self.prepare_request(identifiers, packages))
+        elapsed = time.monotonic() - start
+        if response.status != self.pb2.SUCCESS:
+            raise RuntimeError("prepareEnv failed: %s" % '\n'.join(response.response))
+        return elapsed
+
+    def execute(self, identifiers, command):
+        request = self.pb2.ExecutionInput(identifiers=identifiers, requestId='benchmark', command=command,
+                                          timeOut=self.args.timeout)
+        start = time.monotonic()
+        response = self.stub.executeCommand(request)
+        elapsed = time.monotonic() - start
+        if response.status != self.pb2.SUCCESS:
+            raise RuntimeError("executeCommand failed: %s" % '\n'.join(response.response[-20:]))
+        return elapsed, response
+
+    def run_prepare_env(self):
+        cold, shared, warm = [], [], []
+        for run in range(self.args.prepare_runs):
+            packages = []
+            for i in range(self.args.packages):
+                name = 'cdsbench-run%d-pkg%d' % (run, i)
+                build_wheel(self.index, name)
+                packages.append(name)
+            first = self.create_blueprint()
+            cold.append(self.prepare(first, packages))
+            warm.append(self.prepare(first, packages))
+            shared.append(self.prepare(self.create_blueprint(), packages))
+        return {'packages': self.args.packages, 'cold': summarize(cold), 'shared': summarize(shared),
+                'warm': summarize(warm)}
+
+    def run_execute_command(self, identifiers):
+        results = []
+        for concurrency in self.args.concurrency:
+            latencies = []
+            start = time.monotonic()
+            with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for elapsed, _ in executor.map(lambda _: self.execute(identifiers, 'python Scripts/python/emit.py 0'),
+                                               range(self.args.requests)):
+                    latencies.append(elapsed)
+            wall = time.monotonic() - start
+            results.append({'concurrency': concurrency, 'requests': self.args.requests, 'seconds': wall,
+                            'throughput': self.args.requests / wall, 'latency': summarize(latencies)})
+        return results
+
+    def run_output(self, identifiers):
+        results = []
+        for size in self.args.output_sizes:
+            elapsed, response = self.execute(identifiers, 'python Scripts/python/emit.py %d' % size)
+            results.append({'output_bytes': size, 'seconds': elapsed, 'response_bytes': response.ByteSize(),
+                            'response_lines': len(response.response),
+                            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+        return results
+
+    def run(self):
+        import grpc
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'revision': get_revision(),
+            'python': platform.python_version(),
+            'grpcio': grpc.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'server': self.args.server,
+            'settings': self.settings
+        }
+        report['prepare_env'] = self.run_prepare_env()
+        identifiers = self.create_blueprint()
+        self.prepare(identifiers, [])
+        report['execute_command'] = self.run_execute_command(identifiers)
+        report['output'] = self.run_output(identifiers)
+        return report
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SOURCES, stderr=subprocess.DEVNULL).decode() \
+            .strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the command executor')
+    parser.add_argument('--server', choices=('thread', 'aio'), default='thread')
+    parser.add_argument('--workers', type=int, default=15, help='threads of the threaded server')
+    parser.add_argument('--packages', type=int, default=5, help='pip packages per prepareEnv')
+    parser.add_argument('--prepare-runs', type=int, default=3)
+    parser.add_argument('--concurrency', default='1,4,16,64',
+                        type=lambda value: [int(level) for level in value.split(',')])
+    parser.add_argument('--requests', type=int, default=200, help='executeCommand requests per concurrency level')
+    parser.add_argument('--output-sizes', default='1K,1M,100M,500M',
+                        type=lambda value: [parse_size(size) for size in value.split(',')])
+    parser.add_argument('--timeout', type=int, default=0, help='timeOut of every request, in seconds')
+    parser.add_argument('--output', help='file to write the JSON results to, stdout by default')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark directory')
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args)
+    try:
+        report = benchmark.run()
+    finally:
+        benchmark.close()
+
+    results = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()